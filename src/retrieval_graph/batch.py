@@ -0,0 +1,127 @@
+"""Offline query classification through the Anthropic Message Batches API.
+
+Bulk jobs such as re-classifying a corpus of questions do not need answers
+within seconds. Submitting them as one message batch costs half the input
+token price of real-time calls. The graph's per-turn classification keeps
+using `classify_query`; this module is for offline use only.
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Iterable
+
+from pydantic import ValidationError
+
+from retrieval_graph import prompts
+from retrieval_graph.schemas import QueryClassification
+
+# Anthropic only accepts custom_ids of up to 64 characters from [a-zA-Z0-9_-]
+_CUSTOM_ID_LENGTH = 32
+
+
+def classification_custom_id(question: str) -> str:
+    """Return the batch custom_id identifying a question."""
+    return hashlib.sha256(question.encode()).hexdigest()[:_CUSTOM_ID_LENGTH]
+
+
+def build_classification_requests(
+    questions: Iterable[str], model: str, max_tokens: int = 256
+) -> list[dict[str, Any]]:
+    """Build one Message Batches request per distinct question.
+
+    Every request carries the same static system prompt and forces the
+    QueryClassification tool, mirroring the real-time structured output call.
+
+    Args:
+        questions (Iterable[str]): The questions to classify; duplicates are sent once.
+        model (str): The Anthropic model name, with or without the "anthropic/" prefix.
+        max_tokens (int): Output token limit per request.
+
+    Returns:
+        list[dict[str, Any]]: Requests for `messages.batches.create`.
+    """
+    provider, _, model_name = model.rpartition("/")
+    if provider not in ("", "anthropic"):
+        raise ValueError(f"Message batches require an Anthropic model, got: {model}")
+
+    tool = {
+        "name": QueryClassification.__name__,
+        "description": QueryClassification.__doc__,
+        "input_schema": QueryClassification.model_json_schema(),
+    }
+    requests = {}
+    for question in questions:
+        custom_id = classification_custom_id(question)
+        if custom_id in requests:
+            continue
+        requests[custom_id] = {
+            "custom_id": custom_id,
+            "params": {
+                "model": model_name,
+                "max_tokens": max_tokens,
+                "system": prompts.CLASSIFICATION_SYSTEM_PROMPT_PREFIX,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": prompts.CLASSIFICATION_PROMPT_SUFFIX.format(
+                            question=question
+                        ),
+                    }
+                ],
+                "tools": [tool],
+                "tool_choice": {"type": "tool", "name": tool["name"]},
+            },
+        }
+    return list(requests.values())
+
+
+def _subject_from_result(entry: Any) -> str | None:
+    """Extract the subject from one batch result, or None if it failed."""
+    if entry.result.type != "succeeded":
+        return None
+    for block in entry.result.message.content:
+        if block.type == "tool_use":
+            try:
+                return QueryClassification.model_validate(block.input).subject
+            except ValidationError:
+                return None
+    return None
+
+
+async def aclassify_offline(
+    questions: Iterable[str],
+    model: str = "anthropic/claude-3-haiku-20240307",
+    poll_interval: float = 30.0,
+) -> dict[str, str | None]:
+    """Classify questions with one message batch and wait for the results.
+
+    Batches usually finish within an hour and may take up to a day, so this
+    polls every `poll_interval` seconds.
+
+    Args:
+        questions (Iterable[str]): The questions to classify.
+        model (str): The Anthropic model name.
+        poll_interval (float): Seconds between status checks.
+
+    Returns:
+        dict[str, str | None]: The subject for each question, or None where
+        the request errored, expired or returned no valid subject.
+    """
+    from anthropic import AsyncAnthropic
+
+    questions = list(dict.fromkeys(questions))
+    if not questions:
+        return {}
+
+    client = AsyncAnthropic()
+    batch = await client.messages.batches.create(
+        requests=build_classification_requests(questions, model)  # type: ignore[arg-type]
+    )
+    while batch.processing_status != "ended":
+        await asyncio.sleep(poll_interval)
+        batch = await client.messages.batches.retrieve(batch.id)
+
+    subjects: dict[str, str | None] = {}
+    async for entry in await client.messages.batches.results(batch.id):
+        subjects[entry.custom_id] = _subject_from_result(entry)
+    return {q: subjects.get(classification_custom_id(q)) for q in questions}
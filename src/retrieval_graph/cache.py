@@ -0,0 +1,142 @@
+"""In-process caches shared across graph runs.
+
+SemanticCache reuses agent responses for questions whose embeddings are
+nearly identical to an earlier question asked against the same documents.
+TTLCache holds recent results that may be reused until they expire.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Sequence
+
+from retrieval_graph.utils import normalize_vector
+
+
+@dataclass
+class _CacheEntry:
+    """A cached response with the unit-length embedding of its question."""
+
+    vector: list[float]
+    response: str
+    hits: int = 0
+
+
+class SemanticCache:
+    """Response cache keyed on question embedding similarity.
+
+    Entries are grouped under an exact key (for example user, subject and a
+    digest of the retrieved documents), and within a group a lookup matches
+    the most similar cached question at or above the similarity threshold.
+    When full, the least frequently hit entry is evicted.
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        """Create an empty cache holding at most `max_entries` responses."""
+        self.max_entries = max_entries
+        self._groups: dict[Hashable, list[_CacheEntry]] = {}
+        self._size = 0
+
+    def lookup(
+        self, key: Hashable, vector: Sequence[float], threshold: float
+    ) -> str | None:
+        """Return the cached response for the most similar question, if close enough.
+
+        Args:
+            key (Hashable): The exact-match part of the cache key.
+            vector (Sequence[float]): Embedding of the question.
+            threshold (float): Minimum cosine similarity for a hit.
+
+        Returns:
+            Optional[str]: The cached response, or None on a miss.
+        """
+        entries = self._groups.get(key)
+        if not entries:
+            return None
+        query = normalize_vector(vector)
+        best, best_score = None, threshold
+        for entry in entries:
+            score = sum(q * v for q, v in zip(query, entry.vector))
+            if score >= best_score:
+                best, best_score = entry, score
+        if best is None:
+            return None
+        best.hits += 1
+        return best.response
+
+    def store(self, key: Hashable, vector: Sequence[float], response: str) -> None:
+        """Cache a response, evicting the least frequently hit entry when full.
+
+        Args:
+            key (Hashable): The exact-match part of the cache key.
+            vector (Sequence[float]): Embedding of the question.
+            response (str): The response to reuse for similar questions.
+        """
+        if self.max_entries <= 0:
+            return
+        if self._size >= self.max_entries:
+            self._evict()
+        self._groups.setdefault(key, []).append(
+            _CacheEntry(normalize_vector(vector), response)
+        )
+        self._size += 1
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        self._groups.clear()
+        self._size = 0
+
+    def _evict(self) -> None:
+        """Remove the entry with the fewest hits (the oldest among ties)."""
+        victim_key, victim_index, fewest = None, 0, None
+        for key, entries in self._groups.items():
+            for index, entry in enumerate(entries):
+                if fewest is None or entry.hits < fewest:
+                    victim_key, victim_index, fewest = key, index, entry.hits
+        if victim_key is None:
+            return
+        entries = self._groups[victim_key]
+        del entries[victim_index]
+        if not entries:
+            del self._groups[victim_key]
+        self._size -= 1
+
+
+class TTLCache:
+    """Least recently used cache whose entries expire after a time to live."""
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        """Create an empty cache holding at most `max_entries` values."""
+        self.max_entries = max_entries
+        # key -> (expiry on the monotonic clock, value), least recently used first
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the value cached under `key`, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """Cache `value` under `key` for `ttl` seconds, evicting the least recently used."""
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drop every entry whose key satisfies `predicate`."""
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        """Drop every cached value."""
+        self._entries.clear()
@@ -0,0 +1,215 @@
+"""Embedding-based query classification.
+
+Routing a question to a specialist normally costs an LLM call. This module
+classifies questions locally instead by comparing the question embedding to
+per-subject centroids built from labeled example questions. When the best
+subject does not win by a clear margin, the caller falls back to the LLM.
+`keyword_subject` is a cheaper first pass that needs no model at all.
+"""
+
+import asyncio
+import re
+import weakref
+
+from langchain_core.embeddings import Embeddings
+
+from retrieval_graph.retrieval import make_text_encoder
+from retrieval_graph.utils import normalize_vector
+
+# Labeled example questions used to build each subject's centroid.
+SUBJECT_EXAMPLES: dict[str, tuple[str, ...]] = {
+    "science": (
+        "Explain quantum entanglement",
+        "How does photosynthesis convert light into chemical energy?",
+        "What is the difference between mitosis and meiosis?",
+        "Why is the sky blue?",
+        "How do vaccines train the immune system?",
+        "What does Newton's second law state?",
+        "How do black holes form?",
+        "What is a derivative in calculus?",
+        "How does a neural network learn?",
+        "What causes earthquakes?",
+    ),
+    "history": (
+        "What caused the fall of the Roman Empire?",
+        "Why did World War I start?",
+        "Who was Genghis Khan?",
+        "What were the effects of the Industrial Revolution?",
+        "How did the Cold War end?",
+        "What was the significance of the Magna Carta?",
+        "Why did the French Revolution happen?",
+        "What was life like in ancient Egypt?",
+        "How did the civil rights movement change American society?",
+        "What led to the collapse of the Soviet Union?",
+    ),
+    "literature": (
+        "Analyze the symbolism in The Great Gatsby",
+        "What are the main themes of Hamlet?",
+        "How does Toni Morrison use narrative structure in Beloved?",
+        "What is magical realism?",
+        "Explain the use of the unreliable narrator",
+        "What defines Romantic poetry?",
+        "Who wrote One Hundred Years of Solitude and what is it about?",
+        "What is the meaning of the green light in Gatsby?",
+        "Compare the heroines of Jane Austen's novels",
+        "What is a sonnet and how is it structured?",
+    ),
+    "general": (
+        "Hello",
+        "Thanks for the help",
+        "How do I prepare for a job interview?",
+        "What is a good recipe for dinner tonight?",
+        "How are you?",
+        "What should I consider when buying a laptop?",
+        "What is the meaning of life?",
+        "How can I improve my sleep?",
+        "Recommend a good movie",
+        "Goodbye",
+    ),
+}
+
+
+# Distinctive words per subject for the keyword pre-router. A question is only
+# routed by keyword when every match points to the same subject.
+SUBJECT_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "science": (
+        "atom", "atoms", "biology", "black hole", "black holes", "calculus", "cell", "cells",
+        "chemical", "chemistry", "dna", "electron", "electrons", "energy", "entanglement",
+        "evolution", "gene", "genes", "gravity", "molecule", "molecules", "neuron",
+        "photosynthesis", "physics", "protein", "quantum", "relativity", "thermodynamics",
+        "vaccine", "vaccines",
+    ),
+    "history": (
+        "ancient", "cold war", "colonial", "colonialism", "dynasty", "empire", "feudal",
+        "historical", "history", "medieval", "ottoman", "pharaoh", "renaissance", "revolution",
+        "roman", "world war", "wwi", "wwii",
+    ),
+    "literature": (
+        "author", "character", "characters", "gatsby", "hamlet", "literary", "literature",
+        "metaphor", "narrator", "novel", "novels", "poem", "poems", "poet", "poetry",
+        "protagonist", "shakespeare", "sonnet", "symbolism",
+    ),
+}
+
+_GREETING_RE = re.compile(
+    r"\s*(?:hi|hello|hey|thanks|thank you|good (?:morning|afternoon|evening)"
+    r"|bye|goodbye|how are you)(?: there)?[\s!.?,]*",
+    re.IGNORECASE,
+)
+# One alternation with a named group per subject; longer phrases come first
+_KEYWORD_RE = re.compile(
+    "|".join(
+        rf"(?P<{subject}>\b(?:"
+        + "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        + r")\b)"
+        for subject, keywords in SUBJECT_KEYWORDS.items()
+    ),
+    re.IGNORECASE,
+)
+
+
+def keyword_subject(question: str) -> str | None:
+    """Classify a question from greetings and subject keywords alone.
+
+    Args:
+        question (str): The user question.
+
+    Returns:
+        Optional[str]: "general" for a bare greeting, the subject when all
+        keyword matches agree, or None when there is no clear signal.
+    """
+    if _GREETING_RE.fullmatch(question):
+        return "general"
+    subjects = {match.lastgroup for match in _KEYWORD_RE.finditer(question)}
+    if len(subjects) == 1:
+        return subjects.pop()
+    return None
+
+
+class EmbeddingClassifier:
+    """Nearest-centroid classifier over question embeddings."""
+
+    def __init__(
+        self, embeddings: Embeddings, centroids: dict[str, list[float]]
+    ) -> None:
+        """Create a classifier from an encoder and unit-length subject centroids."""
+        self.embeddings = embeddings
+        self.centroids = centroids
+
+    @classmethod
+    async def from_examples(
+        cls,
+        embeddings: Embeddings,
+        examples: dict[str, tuple[str, ...]] = SUBJECT_EXAMPLES,
+    ) -> "EmbeddingClassifier":
+        """Embed the example questions and average them into one centroid per subject.
+
+        Args:
+            embeddings (Embeddings): The encoder used for examples and questions.
+            examples (dict[str, tuple[str, ...]]): Example questions keyed by subject.
+
+        Returns:
+            EmbeddingClassifier: A classifier over the given subjects.
+        """
+        subjects = list(examples)
+        texts = [text for subject in subjects for text in examples[subject]]
+        vectors = await embeddings.aembed_documents(texts)
+
+        centroids = {}
+        offset = 0
+        for subject in subjects:
+            count = len(examples[subject])
+            members = [normalize_vector(v) for v in vectors[offset : offset + count]]
+            offset += count
+            centroids[subject] = normalize_vector([sum(dim) for dim in zip(*members)])
+        return cls(embeddings, centroids)
+
+    async def aclassify(self, question: str, margin: float) -> str | None:
+        """Classify a question, or return None when the result is ambiguous.
+
+        Args:
+            question (str): The user question.
+            margin (float): Minimum cosine similarity lead of the best subject over the runner-up.
+
+        Returns:
+            Optional[str]: The subject, or None if no subject leads by at least `margin`.
+        """
+        query = normalize_vector(await self.embeddings.aembed_query(question))
+        scores = sorted(
+            (
+                (sum(q * c for q, c in zip(query, centroid)), subject)
+                for subject, centroid in self.centroids.items()
+            ),
+            reverse=True,
+        )
+        if len(scores) > 1 and scores[0][0] - scores[1][0] < margin:
+            return None
+        return scores[0][1]
+
+
+# One classifier per embedding model, built on first use.
+_CLASSIFIERS: dict[str, EmbeddingClassifier] = {}
+# Locks serializing classifier builds, per event loop since a lock is bound to one
+_BUILD_LOCKS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Lock]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def get_classifier(embedding_model: str) -> EmbeddingClassifier:
+    """Return the shared classifier for an embedding model, building it once.
+
+    Concurrent callers on one event loop wait for the same build; a failed
+    build is not cached. The built classifier is shared by every loop.
+    """
+    classifier = _CLASSIFIERS.get(embedding_model)
+    if classifier is not None:
+        return classifier
+    locks = _BUILD_LOCKS.setdefault(asyncio.get_running_loop(), {})
+    async with locks.setdefault(embedding_model, asyncio.Lock()):
+        classifier = _CLASSIFIERS.get(embedding_model)
+        if classifier is None:
+            classifier = await EmbeddingClassifier.from_examples(
+                make_text_encoder(embedding_model)
+            )
+            _CLASSIFIERS[embedding_model] = classifier
+    return classifier
@@ -2,13 +2,36 @@
 
 from __future__ import annotations
 
+import copy
+import functools
+import os
 from dataclasses import dataclass, field, fields
-from typing import Annotated, Any, Literal, Optional, Type, TypeVar
+from typing import Annotated, Any, Literal, Type, TypeVar
 
 from langchain_core.runnables import RunnableConfig, ensure_config
 
 from retrieval_graph import prompts
-import os
+
+# Environment variables read by field defaults; part of the configuration cache key
+_ENV_DEFAULTS = ("USER_ID", "ELASTICSEARCH_HOST", "ELASTICSEARCH_PORT", "TAVILY_API_KEY")
+
+
+@functools.cache
+def _normalize_embedding_model(embedding_model: str) -> str:
+    """Rewrite an embedding model name into the ``google/models/...`` format, once per name."""
+    if embedding_model.startswith("google/") and not embedding_model.startswith("google/models/"):
+        if "text-embedding-005" in embedding_model:
+            # text-embedding-005 is not available, use text-embedding-004 instead
+            return "google/models/text-embedding-004"
+        if "text-embedding-004" in embedding_model:
+            return "google/models/text-embedding-004"
+        # For other Google models, add the models/ prefix
+        model_name = embedding_model.split("/", 1)[1]
+        return f"google/models/{model_name}"
+    if "/" not in embedding_model:
+        # If no provider specified, assume it's a Google model and add the proper prefix
+        return f"google/models/{embedding_model}"
+    return embedding_model
 
 
 @dataclass(kw_only=True)
@@ -45,6 +68,15 @@ class IndexConfiguration:
         },
     )
 
+    embedding_dimensions: int | None = field(
+        default=None,
+        metadata={
+            "description": "Number of dimensions to truncate embeddings to, for models that support "
+            "it (e.g. 256 for text-embedding-004). Smaller vectors shrink requests and the index, "
+            "but an existing index must be rebuilt when this changes. None uses the full size."
+        },
+    )
+
     retriever_provider: Annotated[
         Literal["elastic-local"],
         {"__template_metadata__": {"kind": "retriever"}},
@@ -63,6 +95,44 @@ class IndexConfiguration:
         },
     )
 
+    url_concurrency: int = field(
+        default=8,
+        metadata={
+            "description": "Maximum number of URLs fetched concurrently when indexing documents from URLs."
+        },
+    )
+
+    url_cache_dir: str = field(
+        default="",
+        metadata={
+            "description": "Directory for a persistent cache of text extracted from URLs. Cached "
+            "extractions are reused while the server answers conditional requests with 304 Not "
+            "Modified. Empty disables the cache."
+        },
+    )
+
+    index_batch_size: int = field(
+        default=100,
+        metadata={
+            "description": "Number of documents sent to the vector store per add_documents call when indexing."
+        },
+    )
+
+    index_concurrency: int = field(
+        default=2,
+        metadata={
+            "description": "Maximum number of indexing batches sent to the vector store concurrently."
+        },
+    )
+
+    retrieval_cache_ttl: float = field(
+        default=0,
+        metadata={
+            "description": "Seconds to reuse the results of an identical search by the same user. "
+            "0 disables the retrieval cache."
+        },
+    )
+
     def __post_init__(self):
         """Validate configuration after initialization."""
         if not self.user_id or self.user_id == "default_user":
@@ -71,26 +141,13 @@ class IndexConfiguration:
         # Ensure embedding_model is not None or empty
         if not self.embedding_model:
             self.embedding_model = "google/text-embedding-004"
-        
+
         # Fix Google embedding model names to the correct format
-        if self.embedding_model:
-            if self.embedding_model.startswith("google/") and not self.embedding_model.startswith("google/models/"):
-                if "text-embedding-005" in self.embedding_model:
-                    # text-embedding-005 is not available, use text-embedding-004 instead
-                    self.embedding_model = "google/models/text-embedding-004"
-                elif "text-embedding-004" in self.embedding_model:
-                    self.embedding_model = "google/models/text-embedding-004"
-                else:
-                    # For other Google models, add the models/ prefix
-                    model_name = self.embedding_model.split("/", 1)[1]
-                    self.embedding_model = f"google/models/{model_name}"
-            elif "/" not in self.embedding_model:
-                # If no provider specified, assume it's a Google model and add the proper prefix
-                self.embedding_model = f"google/models/{self.embedding_model}"
+        self.embedding_model = _normalize_embedding_model(self.embedding_model)
 
     @classmethod
     def from_runnable_config(
-        cls: Type[T], config: Optional[RunnableConfig] = None
+        cls: Type[T], config: RunnableConfig | None = None
     ) -> T:
         """Create an IndexConfiguration instance from a RunnableConfig object.
 
@@ -103,8 +160,48 @@ class IndexConfiguration:
         """
         config = ensure_config(config)
         configurable = config.get("configurable") or {}
-        _fields = {f.name for f in fields(cls) if f.init}
-        return cls(**{k: v for k, v in configurable.items() if k in _fields})
+        _fields = _init_field_names(cls)
+        items = tuple(
+            sorted((k, v) for k, v in configurable.items() if k in _fields)
+        )
+        env = tuple(os.environ.get(key) for key in _ENV_DEFAULTS)
+        try:
+            cached = _cached_from_items(cls, items, env)
+        except TypeError:
+            # Unhashable values (e.g. a custom search_kwargs dict) bypass the cache.
+            return cls(**dict(items))
+        return _copy_configuration(cached)
+
+
+@functools.cache
+def _init_field_names(cls: type) -> frozenset[str]:
+    """Return the names of the init fields of a configuration dataclass."""
+    return frozenset(f.name for f in fields(cls) if f.init)
+
+
+@functools.lru_cache(maxsize=128)
+def _cached_from_items(
+    cls: Type[T], items: tuple[tuple[str, Any], ...], env: tuple[str | None, ...]
+) -> T:
+    """Build a configuration once per distinct set of configurable values.
+
+    Every graph node resolves its configuration from the same configurable
+    values, so caching on them skips repeated validation in ``__post_init__``.
+    `env` holds the environment variables read by field defaults, so changing
+    one builds a new configuration. The result is a template: callers get a
+    copy from `_copy_configuration`.
+    """
+    return cls(**dict(items))
+
+
+def _copy_configuration(template: T) -> T:
+    """Copy a cached configuration so callers can't change it for later runs."""
+    configuration = copy.copy(template)
+    for f in fields(configuration):
+        value = getattr(configuration, f.name)
+        if isinstance(value, (dict, list)):
+            setattr(configuration, f.name, copy.deepcopy(value))
+    return configuration
 
 
 T = TypeVar("T", bound=IndexConfiguration)
@@ -140,6 +237,61 @@ class Configuration(IndexConfiguration):
         },
     )
 
+    keyword_classifier: bool = field(
+        default=False,
+        metadata={
+            "description": "Whether to classify greetings and questions with unambiguous subject "
+            "keywords locally, before any model-based classification."
+        },
+    )
+
+    embedding_classifier: bool = field(
+        default=False,
+        metadata={
+            "description": "Whether to classify queries by embedding similarity to example questions, "
+            "falling back to query_model only when the result is ambiguous."
+        },
+    )
+
+    classification_margin: float = field(
+        default=0.05,
+        metadata={
+            "description": "Minimum cosine similarity lead the best subject needs over the runner-up "
+            "for the embedding classifier's answer to be used."
+        },
+    )
+
+    semantic_cache: bool = field(
+        default=False,
+        metadata={
+            "description": "Whether to reuse an earlier agent answer when a new question is nearly "
+            "identical (by embedding similarity) and was asked against the same documents."
+        },
+    )
+
+    semantic_cache_threshold: float = field(
+        default=0.92,
+        metadata={
+            "description": "Minimum cosine similarity between questions for a cached answer to be reused."
+        },
+    )
+
+    heuristic_critique: bool = field(
+        default=False,
+        metadata={
+            "description": "Whether to score responses with a local heuristic first and only ask the "
+            "model to critique responses whose score is inconclusive."
+        },
+    )
+
+    compact_docs: bool = field(
+        default=False,
+        metadata={
+            "description": "Whether to give agents compact, canonically ordered document digests "
+            "instead of the full retrieved documents."
+        },
+    )
+
     enable_web_search: bool = field(
         default=True,
         metadata={
@@ -154,6 +306,14 @@ class Configuration(IndexConfiguration):
         },
     )
 
+    prefetch_retrieval: bool = field(
+        default=False,
+        metadata={
+            "description": "Whether to retrieve documents for the user question in parallel with query classification. "
+            "Costs an embedding and a search on every turn, including ones that need no documents."
+        },
+    )
+
     min_retrieval_threshold: int = field(
         default=2,
         metadata={
@@ -0,0 +1,89 @@
+"""Deterministic scoring of agent responses.
+
+Most responses are clearly good or clearly poor, and judging them does not
+need a model. `score_response` rates a response from simple text signals so
+the critique step only calls the LLM when the score is inconclusive.
+"""
+
+import re
+from typing import Sequence
+
+from langchain_core.documents import Document
+
+# Scores at or above this are accepted without an LLM critique.
+RESPOND_THRESHOLD = 80
+# Scores below this send the agent back for better documents.
+IMPROVE_QUERY_THRESHOLD = 50
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CITATION_RE = re.compile(r"\[Source:\s*([^\]]+)\]", re.IGNORECASE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from how i in is it me my of on or "
+    "the this to was what when where which who why will with you your".split()
+)
+_SMALL_TALK = frozenset(
+    "hello hi hey thanks thank bye goodbye ok okay morning evening afternoon good "
+    "how are you see great cool".split()
+)
+# Response length (in words) that earns full completeness credit
+_TARGET_WORDS = 150
+
+
+def _content_terms(text: str) -> set[str]:
+    """Lowercased words of `text` without stopwords."""
+    return {w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def score_response(
+    user_question: str, agent_response: str, retrieved_docs: Sequence[Document]
+) -> tuple[int, str]:
+    """Score an agent response from 0 to 100 with a short explanation.
+
+    The score combines relevance (question terms covered by the response, 40
+    points), completeness (response length, 30 points) and source integration
+    (citations that match retrieved documents, 30 points). Simple greetings
+    and small talk score 100 when answered at all.
+
+    Args:
+        user_question (str): The question the agent answered.
+        agent_response (str): The agent's response text.
+        retrieved_docs (Sequence[Document]): The documents available to the agent.
+
+    Returns:
+        tuple[int, str]: The score and the reasoning behind it.
+    """
+    response = agent_response.strip()
+    if not response:
+        return 0, "The response is empty."
+
+    question_words = set(_WORD_RE.findall(user_question.lower()))
+    if question_words and question_words <= _SMALL_TALK:
+        return 100, "Simple interaction answered directly."
+
+    question_terms = _content_terms(user_question)
+    covered = question_terms & _content_terms(response)
+    relevance = 40 * len(covered) / len(question_terms) if question_terms else 40
+    completeness = 30 * min(1.0, len(response.split()) / _TARGET_WORDS)
+
+    citations = [c.strip().lower() for c in _CITATION_RE.findall(response)]
+    if retrieved_docs:
+        names = {
+            str(doc.metadata.get(key, "")).lower()
+            for doc in retrieved_docs
+            for key in ("source", "title")
+        } - {""}
+        matched = sum(
+            1 for c in citations if any(c in name or name in c for name in names)
+        )
+        # Uncited answers still get partial credit: tools are optional
+        sources = 30 * matched / len(citations) if citations else 15
+    else:
+        # Citations without any documents cannot be backed by a source
+        sources = 0 if citations else 30
+
+    score = round(relevance + completeness + sources)
+    reasoning = (
+        f"Heuristic score {score}/100: covers {len(covered)} of {len(question_terms)} "
+        f"question terms, {len(response.split())} words, {len(citations)} citation(s)."
+    )
+    return score, reasoning
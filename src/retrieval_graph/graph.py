@@ -6,35 +6,118 @@ and key functions for processing user inputs, generating queries, retrieving
 relevant documents, and formulating responses.
 """
 
-from typing import Literal, cast
+import functools
+import logging
+import string
+from collections import OrderedDict, deque
+from typing import Any, Callable, Sequence, cast
 
 from langchain_core.documents import Document
-from langchain_core.messages import BaseMessage, ToolMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableConfig
-from langchain_core.tools import tool
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.tools import BaseTool, tool
 from langgraph.graph import StateGraph
 from pydantic import BaseModel
 
 from retrieval_graph import prompts, retrieval
+from retrieval_graph.cache import SemanticCache
+from retrieval_graph.classification import get_classifier, keyword_subject
 from retrieval_graph.configuration import Configuration
-from retrieval_graph.state import InputState, State
-from retrieval_graph.utils import format_docs_safe, get_message_text, load_chat_model
+from retrieval_graph.critique import (
+    IMPROVE_QUERY_THRESHOLD,
+    RESPOND_THRESHOLD,
+    score_response,
+)
+from retrieval_graph.schemas import CritiqueDecision, QueryClassification
+from retrieval_graph.state import MAX_RETRIEVED_DOCS, InputState, State
+from retrieval_graph.utils import (
+    format_doc_digests,
+    format_docs_safe,
+    format_docs_safe_parts,
+    get_message_text,
+    load_chat_model,
+)
 
-# Define the function that calls the model
 
-class QueryClassification(BaseModel):
-    """Classification of user query into subject areas."""
-    
-    subject: Literal["science", "history", "literature", "general"]
+def _compile_prompt(prefix: str, suffix: str) -> Callable[..., list[BaseMessage]]:
+    """Compile a prompt into a function that renders its messages.
 
+    The static `prefix` becomes a system message that is byte-identical on
+    every call, so provider prefix caches can reuse it. Rendering with
+    `cache_prefix=True` marks it with an Anthropic `cache_control` breakpoint.
+    The `suffix` template is split into literal text and field names once, so
+    rendering only joins the segments with the values instead of re-parsing it.
 
-class CritiqueDecision(BaseModel):
-    """Decision from critique agent whether to retry or respond."""
-    
-    decision: Literal["respond", "retry", "improve_query"]
-    reasoning: str
+    A value may also be a list of strings: stable parts (such as one per
+    document) followed by a closing part. With `cache_prefix=True` each part is
+    sent as its own content block and the last stable part gets a second cache
+    breakpoint, so when parts are appended between calls the unchanged leading
+    parts still hit the cache. Anthropic allows four breakpoints per request,
+    so use at most one list-valued field.
+
+    Args:
+        prefix (str): The static instructions, without any template fields.
+        suffix (str): A `str.format`-style template for the per-request inputs.
+
+    Returns:
+        Callable[..., list[BaseMessage]]: Renders the messages from keyword values.
+    """
+    system_message = SystemMessage(content=prefix)
+    cached_system_message = SystemMessage(
+        content=[{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}]
+    )
+    segments = tuple(
+        (literal, field_name)
+        for literal, field_name, _, _ in string.Formatter().parse(suffix)
+    )
+
+    def render(*, cache_prefix: bool = False, **values: Any) -> list[BaseMessage]:
+        parts: list[str] = []
+        blocks: list[dict[str, Any]] = []
+        for literal, field_name in segments:
+            parts.append(literal)
+            if field_name is None:
+                continue
+            value = values[field_name]
+            if not isinstance(value, list):
+                parts.append(str(value))
+            elif not cache_prefix:
+                parts.extend(value)
+            elif value:
+                *stable, closing = value
+                for item in stable:
+                    parts.append(item)
+                    blocks.append({"type": "text", "text": "".join(parts)})
+                    parts.clear()
+                if blocks:
+                    blocks[-1]["cache_control"] = {"type": "ephemeral"}
+                parts.append(closing)
+        text = "".join(parts)
+        if blocks and text:
+            blocks.append({"type": "text", "text": text})
+        return [
+            cached_system_message if cache_prefix else system_message,
+            HumanMessage(content=blocks or text),
+        ]
+
+    return render
+
+
+# Prompt templates are compiled once at import time and shared by every call.
+_CLASSIFY_PROMPT = _compile_prompt(
+    prompts.CLASSIFICATION_SYSTEM_PROMPT_PREFIX, prompts.CLASSIFICATION_PROMPT_SUFFIX
+)
+_CRITIQUE_PROMPT = _compile_prompt(
+    prompts.CRITIQUE_SYSTEM_PROMPT_PREFIX, prompts.CRITIQUE_PROMPT_SUFFIX
+)
 
+# Define the function that calls the model
 
 async def classify_query(
     state: State, *, config: RunnableConfig
@@ -44,18 +127,69 @@ async def classify_query(
     
     user_question = get_original_user_question(state)
     
-    prompt = ChatPromptTemplate.from_template(prompts.CLASSIFICATION_SYSTEM_PROMPT)
-    model = load_chat_model(configuration.query_model).with_structured_output(QueryClassification)
-    
-    message_value = await prompt.ainvoke({"question": user_question}, config)
-    classification = cast(QueryClassification, await model.ainvoke(message_value, config))
+    if configuration.keyword_classifier:
+        subject = keyword_subject(user_question)
+        if subject is not None:
+            return {"classification": subject, "original_question": user_question}
+    
+    if configuration.embedding_classifier:
+        try:
+            classifier = await get_classifier(configuration.embedding_model)
+            subject = await classifier.aclassify(
+                user_question, configuration.classification_margin
+            )
+        except Exception:
+            # The LLM classifier below is the fallback for any embedding failure
+            logging.warning("Embedding classification failed", exc_info=True)
+            subject = None
+        if subject is not None:
+            return {"classification": subject, "original_question": user_question}
+    
+    model = _structured_model(configuration.query_model, QueryClassification)
+    
+    messages = _CLASSIFY_PROMPT(
+        question=user_question,
+        cache_prefix=_supports_cache_control(configuration.query_model),
+    )
+    classification = cast(QueryClassification, await model.ainvoke(messages, config))
     
-    return {"classification": classification.subject}
+    return {
+        "classification": classification.subject,
+        "original_question": user_question,
+    }
+
+
+async def classify_batch(
+    questions: Sequence[str], config: RunnableConfig
+) -> list[str]:
+    """Classify many questions with one batched call to the query model.
+
+    Every request shares the same static system prompt, so providers that
+    batch or cache prefixes process them together instead of one at a time.
+
+    Args:
+        questions (Sequence[str]): The questions to classify.
+        config (RunnableConfig): Configuration used to select the query model.
+
+    Returns:
+        list[str]: The subject for each question, in input order.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    model = _structured_model(configuration.query_model, QueryClassification)
+    cache_prefix = _supports_cache_control(configuration.query_model)
+    results = await model.abatch(
+        [_CLASSIFY_PROMPT(question=q, cache_prefix=cache_prefix) for q in questions],
+        config,
+    )
+    return [cast(QueryClassification, result).subject for result in results]
 
 
 # Helper function to get original user question
 def get_original_user_question(state: State) -> str:
     """Extract the original user question from the message history."""
+    if state.original_question is not None:
+        return state.original_question
+
     # Look for the first human message
     for msg in state.messages:
         if hasattr(msg, 'type') and msg.type == 'human':
@@ -95,15 +229,120 @@ async def web_search(query: str) -> str:
 
 # Define tools list for binding to models
 tools = [retrieve_documents, web_search]
+
+
+@functools.lru_cache(maxsize=16)
+def _tooled_model(model_name: str) -> Runnable:
+    """Load a chat model with the retrieval tools bound, once per model name."""
+    return load_chat_model(model_name).bind_tools(tools)
+
+
+@functools.lru_cache(maxsize=16)
+def _structured_model(model_name: str, schema: type[BaseModel]) -> Runnable:
+    """Load a chat model constrained to a structured output schema, once per pair."""
+    return load_chat_model(model_name).with_structured_output(schema)
+
+
+def _supports_cache_control(model_name: str) -> bool:
+    """Whether the model's provider accepts explicit `cache_control` breakpoints."""
+    return model_name.startswith("anthropic/")
+
+
+@functools.lru_cache(maxsize=1)
+def _web_search_tool() -> BaseTool:
+    """Create the Tavily search tool once and reuse it for every web search.
+
+    The import and construction are deferred to the first call because the
+    tool validates TAVILY_API_KEY when it is instantiated.
+    """
+    from langchain_community.tools import TavilySearchResults
+
+    # Limit web search results to 3 for more focused and relevant results
+    return TavilySearchResults(max_results=3)
+
+
+def _preview(content: str, limit: int) -> str:
+    """Shorten content for a tool response, slicing only when it is too long."""
+    if len(content) <= limit:
+        return content
+    return content[:limit] + "..."
+
+
+def _truncate_docs(docs: list[Document]) -> list[Document]:
+    """Truncate retrieved document content before storing it in state."""
+    truncated_docs = []
+    for doc in docs:
+        # Limit individual document content to prevent excessive accumulation
+        if len(doc.page_content) <= 3000:  # 3000 chars ~ 750 tokens
+            # Short documents are stored as-is, without a copy
+            truncated_docs.append(doc)
+            continue
+
+        truncated_doc = Document(
+            page_content=doc.page_content[:3000] + "... [TRUNCATED FOR TOKEN EFFICIENCY]",
+            metadata=doc.metadata
+        )
+        truncated_docs.append(truncated_doc)
+    return truncated_docs
+
+
+def _extend_unique(retrieved_docs: deque[Document], new_docs: list[Document]) -> None:
+    """Append documents whose content is not already in retrieved_docs.
+
+    Retries and repeated tool calls often return the same documents; keeping
+    duplicates would only inflate the prompt.
+    """
+    seen = {doc.page_content for doc in retrieved_docs}
+    for doc in new_docs:
+        if doc.page_content not in seen:
+            seen.add(doc.page_content)
+            retrieved_docs.append(doc)
+
+
+async def prefetch_retrieval(
+    state: State, *, config: RunnableConfig
+) -> dict:
+    """Speculatively retrieve documents for the user question.
+
+    This node runs in parallel with `classify_query`, so the local knowledge
+    base lookup is off the critical path. When the prefetched documents are
+    relevant, the specialist agent can answer without a retrieve_documents
+    tool call round trip.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    if not configuration.prefetch_retrieval:
+        return {}
+
+    user_question = get_original_user_question(state)
+    if not user_question:
+        return {}
+
+    try:
+        docs = await retrieval.aretrieve(user_question, config)
+    except Exception:
+        # Prefetching is best effort; agents can still call the retrieval tool.
+        logging.warning("Prefetching documents failed", exc_info=True)
+        return {}
+
+    if not docs:
+        return {}
+
+    retrieved_docs = deque(state.retrieved_docs, maxlen=MAX_RETRIEVED_DOCS)
+    _extend_unique(retrieved_docs, _truncate_docs(docs))
+    return {"retrieved_docs": retrieved_docs}
+
+
 # Custom tool execution function
 async def handle_tool_calls(state: State, config: RunnableConfig) -> dict:
     """Handle tool calls and execute actual retrieval/search."""
     messages_to_add = []
-    retrieved_docs = list(state.retrieved_docs) if state.retrieved_docs else []
+    configuration = Configuration.from_runnable_config(config)
+    # Bounded deque: the oldest documents are evicted as new ones arrive
+    retrieved_docs = deque(state.retrieved_docs, maxlen=MAX_RETRIEVED_DOCS)
     
     # Find the last message with tool calls
     last_message = state.messages[-1] if state.messages else None
-    if not hasattr(last_message, 'tool_calls') or not last_message.tool_calls:
+    if not getattr(last_message, "tool_calls", None):
         return {"messages": messages_to_add, "retrieved_docs": retrieved_docs}
     
     for tool_call in last_message.tool_calls:
@@ -113,55 +352,39 @@ async def handle_tool_calls(state: State, config: RunnableConfig) -> dict:
         
         if tool_name == "retrieve_documents":
             try:
-                with retrieval.make_retriever(config) as retriever:
-                    # Only retrieve a limited number of documents (k=1 by default from configuration)
-                    docs = await retriever.ainvoke(query, config)
+                # Only retrieve a limited number of documents (k=1 by default from configuration)
+                docs = await retrieval.aretrieve(query, config)
+                
+                # Add to our retrieved documents list
+                if docs:
+                    # Truncate document content before storing to prevent token overflow
+                    truncated_docs = _truncate_docs(docs)
+                    
+                    # Only add relevant documents to state
+                    _extend_unique(retrieved_docs, truncated_docs)
+                    
+                    # Format a summary of the retrieved documents for the tool response
+                    # Keep tool response concise to prevent token overflow
+                    docs_content = "\n\n".join(
+                        f"Document {i+1}:\nContent: {_preview(doc.page_content, 300)}\nSource: {doc.metadata.get('source', 'Unknown')}"
+                        for i, doc in enumerate(docs)
+                    )
+                    content = f"Retrieved {len(docs)} relevant document(s):\n\n{docs_content}"
+                else:
+                    content = "No documents found in the knowledge base for this query."
+                    
+                    # If no documents found in local retrieval and we have web search configured,
+                    # suggest using web_search tool
+                    if configuration.enable_web_search:
+                        content += "\nYou may want to try using web_search for this query."
                     
-                    # Add to our retrieved documents list
-                    if docs:
-                        # Truncate document content before storing to prevent token overflow
-                        truncated_docs = []
-                        for doc in docs:
-                            # Limit individual document content to prevent excessive accumulation
-                            content = doc.page_content
-                            if len(content) > 3000:  # 3000 chars ~ 750 tokens
-                                content = content[:3000] + "... [TRUNCATED FOR TOKEN EFFICIENCY]"
-                            
-                            truncated_doc = Document(
-                                page_content=content,
-                                metadata=doc.metadata
-                            )
-                            truncated_docs.append(truncated_doc)
-                        
-                        # Only add relevant documents to state
-                        retrieved_docs.extend(truncated_docs)
-                        
-                        # Format a summary of the retrieved documents for the tool response
-                        # Keep tool response concise to prevent token overflow
-                        docs_content = "\n\n".join([
-                            f"Document {i+1}:\nContent: {doc.page_content[:300]}...\nSource: {doc.metadata.get('source', 'Unknown')}"
-                            for i, doc in enumerate(docs)
-                        ])
-                        content = f"Retrieved {len(docs)} relevant document(s):\n\n{docs_content}"
-                    else:
-                        content = "No documents found in the knowledge base for this query."
-                        
-                        # If no documents found in local retrieval and we have web search configured,
-                        # suggest using web_search tool
-                        configuration = Configuration.from_runnable_config(config)
-                        if configuration.enable_web_search:
-                            content += "\nYou may want to try using web_search for this query."
-                        
             except Exception as e:
                 content = f"Error during retrieval: {str(e)}"
                 
         elif tool_name == "web_search":
             try:
-                from langchain_community.tools import TavilySearchResults
-                
-                # Limit web search results to 3 for more focused and relevant results
-                search_tool = TavilySearchResults(max_results=3)
-                search_results = search_tool.invoke({"query": query})
+                search_tool = _web_search_tool()
+                search_results = await search_tool.ainvoke({"query": query})
                 
                 web_docs = []
                 for result in search_results:
@@ -182,13 +405,13 @@ async def handle_tool_calls(state: State, config: RunnableConfig) -> dict:
                         web_docs.append(doc)
                 
                 # Add to our retrieved documents list
-                retrieved_docs.extend(web_docs)
+                _extend_unique(retrieved_docs, web_docs)
                 
                 if web_docs:
-                    docs_content = "\n\n".join([
-                        f"Result {i+1}:\nTitle: {doc.metadata.get('title', 'No title')}\nContent: {doc.page_content[:200]}...\nSource: {doc.metadata.get('source', 'Unknown')}"
+                    docs_content = "\n\n".join(
+                        f"Result {i+1}:\nTitle: {doc.metadata.get('title', 'No title')}\nContent: {_preview(doc.page_content, 200)}\nSource: {doc.metadata.get('source', 'Unknown')}"
                         for i, doc in enumerate(web_docs)
-                    ])
+                    )
                     content = f"Found {len(web_docs)} relevant web result(s):\n\n{docs_content}"
                 else:
                     content = "No results found from web search."
@@ -206,158 +429,117 @@ async def handle_tool_calls(state: State, config: RunnableConfig) -> dict:
         )
         messages_to_add.append(tool_message)
     
-    # Limit total documents to prevent token overflow in subsequent calls
-    if len(retrieved_docs) > 5:
-        retrieved_docs = retrieved_docs[-5:]  # Keep only the 5 most recent documents
-    
     return {"messages": messages_to_add, "retrieved_docs": retrieved_docs}
 
 
 # Agent Functions - Simplified specialist agents
-async def science_agent(
-    state: State, *, config: RunnableConfig
-) -> dict:
-    """Science subject specialist agent."""
-    configuration = Configuration.from_runnable_config(config)
-    
-    user_question = get_original_user_question(state)
-    
-    # Check if we have relevant documents
-    if not state.retrieved_docs:
-        retrieved_docs = f"No documents currently available for the question: '{user_question}'. You MUST use retrieve_documents tool immediately with a search query based on this question."
-    else:
-        retrieved_docs = format_docs_safe(state.retrieved_docs)
-    
-    # Create a tool-enabled model
-    model = load_chat_model(configuration.response_model).bind_tools(tools)
-    
-    prompt = ChatPromptTemplate.from_template(prompts.SCIENCE_AGENT_PROMPT)
-    
-    message_value = await prompt.ainvoke({
-        "retrieved_docs": retrieved_docs,
-        "question": user_question,
-        "critique_feedback": state.critique_feedback or "None"
-    }, config)
-    
-    response = await model.ainvoke(message_value, config)
-    
-    # Store agent response content for critique
-    agent_response_content = response.content if response.content else ""
-    
-    return {
-        "messages": [response],
-        "agent_response": agent_response_content
-    }
+_AGENT_PROMPTS = {
+    subject: _compile_prompt(prefix, prompts.AGENT_PROMPT_SUFFIX)
+    for subject, prefix in prompts.AGENT_PROMPT_PREFIXES.items()
+}
 
 
-async def history_agent(
-    state: State, *, config: RunnableConfig
-) -> dict:
-    """History subject specialist agent."""
-    configuration = Configuration.from_runnable_config(config)
-    
-    user_question = get_original_user_question(state)
-    
-    # Check if we have relevant documents
-    if not state.retrieved_docs:
-        retrieved_docs = f"No documents currently available for the question: '{user_question}'. You MUST use retrieve_documents tool immediately with a search query based on this question."
-    else:
-        retrieved_docs = format_docs_safe(state.retrieved_docs)
-    
-    # Create a tool-enabled model
-    model = load_chat_model(configuration.response_model).bind_tools(tools)
-    
-    prompt = ChatPromptTemplate.from_template(prompts.HISTORY_AGENT_PROMPT)
-    
-    message_value = await prompt.ainvoke({
-        "retrieved_docs": retrieved_docs,
-        "question": user_question,
-        "critique_feedback": state.critique_feedback or "None"
-    }, config)
-    
-    response = await model.ainvoke(message_value, config)
-    
-    # Store agent response content for critique
-    agent_response_content = response.content if response.content else ""
-    
-    return {
-        "messages": [response],
-        "agent_response": agent_response_content
-    }
+# Agent answers shared across runs; only consulted when semantic_cache is enabled
+_RESPONSE_CACHE = SemanticCache()
 
+# Recent question embeddings, so agent re-entries after tool calls don't re-embed
+_QUESTION_VECTORS: OrderedDict[tuple[str, str], list[float]] = OrderedDict()
+_QUESTION_VECTORS_SIZE = 256
 
-async def literature_agent(
-    state: State, *, config: RunnableConfig
-) -> dict:
-    """Literature subject specialist agent."""
-    configuration = Configuration.from_runnable_config(config)
-    
-    user_question = get_original_user_question(state)
-    
-    # Check if we have relevant documents
-    if not state.retrieved_docs:
-        retrieved_docs = f"No documents currently available for the question: '{user_question}'. You MUST use retrieve_documents tool immediately with a search query based on this question."
-    else:
-        retrieved_docs = format_docs_safe(state.retrieved_docs)
-    
-    # Create a tool-enabled model
-    model = load_chat_model(configuration.response_model).bind_tools(tools)
-    
-    prompt = ChatPromptTemplate.from_template(prompts.LITERATURE_AGENT_PROMPT)
-    
-    message_value = await prompt.ainvoke({
-        "retrieved_docs": retrieved_docs,
-        "question": user_question,
-        "critique_feedback": state.critique_feedback or "None"
-    }, config)
-    
-    response = await model.ainvoke(message_value, config)
-    
-    # Store agent response content for critique
-    agent_response_content = response.content if response.content else ""
-    
-    return {
-        "messages": [response],
-        "agent_response": agent_response_content
-    }
 
+async def _question_vector(embedding_model: str, question: str) -> list[float]:
+    """Embed a question for the response cache, reusing recent embeddings."""
+    key = (embedding_model, question)
+    vector = _QUESTION_VECTORS.get(key)
+    if vector is not None:
+        _QUESTION_VECTORS.move_to_end(key)
+        return vector
+    encoder = retrieval.make_text_encoder(embedding_model)
+    vector = _QUESTION_VECTORS[key] = await encoder.aembed_query(question)
+    if len(_QUESTION_VECTORS) > _QUESTION_VECTORS_SIZE:
+        _QUESTION_VECTORS.popitem(last=False)
+    return vector
 
-async def general_agent(
-    state: State, *, config: RunnableConfig
+
+async def specialist_agent(
+    state: State, *, config: RunnableConfig, subject: str
 ) -> dict:
-    """General knowledge specialist agent."""
+    """Answer the question as the specialist agent for the given subject."""
     configuration = Configuration.from_runnable_config(config)
     
     user_question = get_original_user_question(state)
     
+    cache_prefix = _supports_cache_control(configuration.response_model)
+    
     # Check if we have relevant documents
+    retrieved_docs: str | list[str]
     if not state.retrieved_docs:
         retrieved_docs = f"No documents currently available for the question: '{user_question}'. You MUST use retrieve_documents tool immediately with a search query based on this question."
+    elif configuration.compact_docs:
+        retrieved_docs = format_doc_digests(state.retrieved_docs)
+    elif cache_prefix:
+        # One content block per document keeps earlier documents cacheable
+        retrieved_docs = format_docs_safe_parts(state.retrieved_docs)
     else:
         retrieved_docs = format_docs_safe(state.retrieved_docs)
     
-    # Create a tool-enabled model
-    model = load_chat_model(configuration.response_model).bind_tools(tools)
+    # Retries after critique feedback always go to the model
+    use_cache = configuration.semantic_cache and not state.critique_feedback
+    if use_cache:
+        docs_key = hash(tuple(doc.page_content for doc in state.retrieved_docs))
+        cache_key = (configuration.user_id, subject, docs_key)
+        try:
+            question_vector = await _question_vector(
+                configuration.embedding_model, user_question
+            )
+        except Exception:
+            logging.warning("Embedding the question for the response cache failed", exc_info=True)
+            use_cache = False
+        else:
+            cached = _RESPONSE_CACHE.lookup(
+                cache_key, question_vector, configuration.semantic_cache_threshold
+            )
+            if cached is not None:
+                return {
+                    "messages": [AIMessage(content=cached)],
+                    "agent_response": cached,
+                    "has_tool_calls": False,
+                }
     
-    prompt = ChatPromptTemplate.from_template(prompts.GENERAL_AGENT_PROMPT)
+    # Create a tool-enabled model
+    model = _tooled_model(configuration.response_model)
     
-    message_value = await prompt.ainvoke({
-        "retrieved_docs": retrieved_docs,
-        "question": user_question,
-        "critique_feedback": state.critique_feedback or "None"
-    }, config)
+    messages = _AGENT_PROMPTS[subject](
+        cache_prefix=cache_prefix,
+        retrieved_docs=retrieved_docs,
+        question=user_question,
+        critique_feedback=state.critique_feedback or "None",
+    )
     
-    response = await model.ainvoke(message_value, config)
+    response = await model.ainvoke(messages, config)
     
     # Store agent response content for critique
     agent_response_content = response.content if response.content else ""
     
+    # Only final text answers are reusable; tool calls depend on this run's state
+    if (use_cache and agent_response_content
+            and isinstance(agent_response_content, str)
+            and not getattr(response, "tool_calls", None)):
+        _RESPONSE_CACHE.store(cache_key, question_vector, agent_response_content)
+    
     return {
         "messages": [response],
-        "agent_response": agent_response_content
+        "agent_response": agent_response_content,
+        "has_tool_calls": bool(getattr(response, "tool_calls", None)),
     }
 
 
+science_agent = functools.partial(specialist_agent, subject="science")
+history_agent = functools.partial(specialist_agent, subject="history")
+literature_agent = functools.partial(specialist_agent, subject="literature")
+general_agent = functools.partial(specialist_agent, subject="general")
+
+
 async def critique_agent(
     state: State, *, config: RunnableConfig
 ) -> dict:
@@ -365,19 +547,32 @@ async def critique_agent(
     configuration = Configuration.from_runnable_config(config)
     
     user_question = get_original_user_question(state)
-    retrieved_docs = format_docs_safe(state.retrieved_docs) if state.retrieved_docs else "No documents available."
     agent_response = state.agent_response or ""
     
-    prompt = ChatPromptTemplate.from_template(prompts.CRITIQUE_SYSTEM_PROMPT)
-    model = load_chat_model(configuration.response_model).with_structured_output(CritiqueDecision)
+    if configuration.heuristic_critique:
+        score, reasoning = score_response(user_question, agent_response, state.retrieved_docs)
+        # Only clear-cut scores skip the LLM; a second low score goes to the
+        # LLM too so a poor answer cannot loop on the heuristic alone
+        if score >= RESPOND_THRESHOLD or (
+            score < IMPROVE_QUERY_THRESHOLD and not state.critique_feedback
+        ):
+            return {
+                "critique_decision": "respond" if score >= RESPOND_THRESHOLD else "improve_query",
+                "critique_feedback": reasoning,
+            }
+    
+    retrieved_docs = format_docs_safe(state.retrieved_docs) if state.retrieved_docs else "No documents available."
+    
+    model = _structured_model(configuration.response_model, CritiqueDecision)
     
-    message_value = await prompt.ainvoke({
-        "agent_response": agent_response,
-        "user_question": user_question,
-        "retrieved_docs": retrieved_docs
-    }, config)
+    messages = _CRITIQUE_PROMPT(
+        cache_prefix=_supports_cache_control(configuration.response_model),
+        agent_response=agent_response,
+        user_question=user_question,
+        retrieved_docs=retrieved_docs,
+    )
     
-    critique = cast(CritiqueDecision, await model.ainvoke(message_value, config))
+    critique = cast(CritiqueDecision, await model.ainvoke(messages, config))
     
     return {
         "critique_decision": critique.decision,
@@ -385,13 +580,50 @@ async def critique_agent(
     }
 
 
+async def critique_batch(
+    items: Sequence[tuple[str, str, str]], config: RunnableConfig
+) -> list[CritiqueDecision]:
+    """Critique many responses with one batched call to the response model.
+
+    Args:
+        items (Sequence[tuple[str, str, str]]): (user_question, agent_response, retrieved_docs)
+            triples, with the documents already formatted.
+        config (RunnableConfig): Configuration used to select the response model.
+
+    Returns:
+        list[CritiqueDecision]: The decision for each item, in input order.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    model = _structured_model(configuration.response_model, CritiqueDecision)
+    cache_prefix = _supports_cache_control(configuration.response_model)
+    results = await model.abatch(
+        [
+            _CRITIQUE_PROMPT(
+                cache_prefix=cache_prefix,
+                user_question=user_question,
+                agent_response=agent_response,
+                retrieved_docs=retrieved_docs,
+            )
+            for user_question, agent_response, retrieved_docs in items
+        ],
+        config,
+    )
+    return [cast(CritiqueDecision, result) for result in results]
+
+
 # Routing functions
+# Maps a classification to its specialist node; anything else goes to general_agent
+_SPECIALIST_ROUTE = {
+    "science": "science_agent",
+    "history": "history_agent",
+    "literature": "literature_agent",
+}
+
+
 def should_continue_to_tools(state: State) -> str:
     """Determine if we should continue to tools or move to critique."""
-    last_message = state.messages[-1]
-    
-    # If the last message has tool calls, go to tools
-    if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
+    # If the last agent response has tool calls, go to tools
+    if state.has_tool_calls:
         return "tools"
     
     # Otherwise, go to critique
@@ -400,23 +632,13 @@ def should_continue_to_tools(state: State) -> str:
 
 def after_tools_routing(state: State) -> str:
     """Route back to the appropriate specialist agent after tools."""
-    classification = state.classification
-    if classification == "science":
-        return "science_agent"
-    elif classification == "history":
-        return "history_agent"
-    elif classification == "literature":
-        return "literature_agent"
-    else:
-        return "general_agent"
+    return _SPECIALIST_ROUTE.get(state.classification, "general_agent")
 
 
 async def respond(
     state: State, *, config: RunnableConfig
 ) -> dict[str, list[BaseMessage]]:
     """Generate final response based on specialist agent output."""
-    from langchain_core.messages import AIMessage
-    
     # Use the stored agent response
     agent_response = state.agent_response or "I apologize, but I couldn't generate a proper response."
     
@@ -427,15 +649,7 @@ async def respond(
 # Routing Functions
 def route_to_specialist(state: State) -> str:
     """Route to the appropriate specialist agent based on classification."""
-    classification = state.classification
-    if classification == "science":
-        return "science_agent"
-    elif classification == "history":
-        return "history_agent"
-    elif classification == "literature":
-        return "literature_agent"
-    else:
-        return "general_agent"
+    return _SPECIALIST_ROUTE.get(state.classification, "general_agent")
 
 
 def critique_router(state: State) -> str:
@@ -459,6 +673,7 @@ builder = StateGraph(State, input=InputState, config_schema=Configuration)
 
 # Add all nodes
 builder.add_node("classify_query", classify_query)
+builder.add_node("prefetch_retrieval", prefetch_retrieval)
 builder.add_node("science_agent", science_agent)
 builder.add_node("history_agent", history_agent)
 builder.add_node("literature_agent", literature_agent)
@@ -469,79 +684,41 @@ builder.add_node("respond", respond)
 
 # Define the flow
 builder.add_edge("__start__", "classify_query")
+# Retrieval for the raw question runs alongside classification
+builder.add_edge("__start__", "prefetch_retrieval")
+
+# Branch maps shared by every conditional edge that uses them
+_SPECIALIST_NODES = ("science_agent", "history_agent", "literature_agent", "general_agent")
+_SPECIALIST_BRANCH_MAP = {node: node for node in _SPECIALIST_NODES}
+_TOOL_BRANCH_MAP = {"tools": "tools", "critique_agent": "critique_agent"}
 
 # Route to specialist agents after classification
 builder.add_conditional_edges(
     "classify_query",
     route_to_specialist,
-    {
-        "science_agent": "science_agent",
-        "history_agent": "history_agent", 
-        "literature_agent": "literature_agent",
-        "general_agent": "general_agent"
-    }
+    _SPECIALIST_BRANCH_MAP,
 )
 
 # From each specialist agent, check if tools need to be called
-builder.add_conditional_edges(
-    "science_agent",
-    should_continue_to_tools,
-    {
-        "tools": "tools",
-        "critique_agent": "critique_agent"
-    }
-)
-
-builder.add_conditional_edges(
-    "history_agent",
-    should_continue_to_tools,
-    {
-        "tools": "tools",
-        "critique_agent": "critique_agent"
-    }
-)
-
-builder.add_conditional_edges(
-    "literature_agent",
-    should_continue_to_tools,
-    {
-        "tools": "tools",
-        "critique_agent": "critique_agent"
-    }
-)
-
-builder.add_conditional_edges(
-    "general_agent",
-    should_continue_to_tools,
-    {
-        "tools": "tools",
-        "critique_agent": "critique_agent"
-    }
-)
+for specialist in _SPECIALIST_NODES:
+    builder.add_conditional_edges(
+        specialist,
+        should_continue_to_tools,
+        _TOOL_BRANCH_MAP,
+    )
 
 # After tools, route back to the appropriate specialist agent
 builder.add_conditional_edges(
     "tools",
     after_tools_routing,
-    {
-        "science_agent": "science_agent",
-        "history_agent": "history_agent",
-        "literature_agent": "literature_agent",
-        "general_agent": "general_agent"
-    }
+    _SPECIALIST_BRANCH_MAP,
 )
 
 # Critique routing - can retry or respond
 builder.add_conditional_edges(
     "critique_agent",
     critique_router,
-    {
-        "respond": "respond",
-        "science_agent": "science_agent",
-        "history_agent": "history_agent", 
-        "literature_agent": "literature_agent",
-        "general_agent": "general_agent"
-    }
+    {"respond": "respond", **_SPECIALIST_BRANCH_MAP},
 )
 
 # Finally, we compile it!
@@ -1,15 +1,52 @@
 """This "graph" simply exposes an endpoint for a user to upload docs to be indexed."""
 
-from typing import Sequence
+import asyncio
+import contextlib
+import hashlib
+import logging
+from typing import AsyncIterable, AsyncIterator, Coroutine, Iterable, Sequence, TypeVar
 
 from langchain_core.documents import Document
 from langchain_core.runnables import RunnableConfig
+from langchain_core.vectorstores import VectorStoreRetriever
 from langgraph.graph import StateGraph
 
 from retrieval_graph import retrieval
 from retrieval_graph.configuration import IndexConfiguration
 from retrieval_graph.state import IndexState
-from retrieval_graph.utils import create_documents_from_urls
+from retrieval_graph.utils import EXTRACTION_ERROR_PREFIXES, create_documents_from_urls
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Document content with one of these prefixes is fetched rather than indexed as text
+_URL_PREFIXES = ("http://", "https://")
+
+# Minimum length of extracted content that counts as meaningful
+_MIN_CONTENT_LENGTH = 200
+
+
+def _validation_error(url: str, doc: Document) -> str | None:
+    """Check that a fetched document contains meaningful content.
+
+    Args:
+        url (str): The URL the document was fetched from.
+        doc (Document): The fetched document.
+
+    Returns:
+        Optional[str]: None if the document is valid, otherwise the reason it was rejected.
+    """
+    # Content is stripped at fetch time, so it is checked as-is
+    content = doc.page_content
+    # Cheapest checks first; the error prefixes only matter for the message
+    if (doc.metadata.get("extraction_success", False)
+            and doc.metadata.get("content_length", len(content)) >= _MIN_CONTENT_LENGTH
+            and content != url):
+        return None
+    if content.startswith(EXTRACTION_ERROR_PREFIXES):
+        return content
+    return "Insufficient content extracted"
 
 
 def ensure_docs_have_user_id(
@@ -17,19 +54,190 @@ def ensure_docs_have_user_id(
 ) -> list[Document]:
     """Ensure that all documents have a user_id in their metadata.
 
+    The user_id is written into each document's metadata in place, so no new
+    Document objects or metadata dicts are allocated. Each document also gets a
+    `content_sha256` digest and a stable id derived from the user and content,
+    so indexing the same content twice maps onto the same stored document.
+
         docs (Sequence[Document]): A sequence of Document objects to process.
         config (RunnableConfig): A configuration object containing the user_id.
 
     Returns:
-        list[Document]: A new list of Document objects with updated metadata.
+        list[Document]: The same Document objects, with updated metadata.
     """
     user_id = config["configurable"]["user_id"]
-    return [
-        Document(
-            page_content=doc.page_content, metadata={**doc.metadata, "user_id": user_id}
+    for doc in docs:
+        digest = hashlib.sha256(doc.page_content.encode()).hexdigest()
+        doc.metadata["user_id"] = user_id
+        doc.metadata["content_sha256"] = digest
+        # The user is part of the id so identical content never crosses users
+        doc.id = hashlib.sha256(f"{user_id}:{digest}".encode()).hexdigest()
+    return docs if isinstance(docs, list) else list(docs)
+
+
+async def _existing_ids(vectorstore: object, ids: list[str]) -> set[str]:
+    """Return the subset of `ids` already present in the vector store.
+
+    Uses `aget_by_ids` when the store implements it and falls back to an
+    Elasticsearch `mget` otherwise. Lookups are best effort: on any failure
+    nothing is treated as existing and the store's upsert-by-id applies.
+    """
+    try:
+        found = await vectorstore.aget_by_ids(ids)  # type: ignore[attr-defined]
+        return {doc.id for doc in found if doc.id}
+    except NotImplementedError:
+        pass
+    except Exception as e:
+        logger.debug("Existing id lookup failed: %s", e)
+        return set()
+
+    client = getattr(vectorstore, "client", None)
+    if client is None or not hasattr(client, "mget"):
+        return set()
+    try:
+        response = await client.mget(
+            index=retrieval.ELASTIC_INDEX_NAME, ids=ids, source=False
         )
-        for doc in docs
-    ]
+    except Exception as e:
+        # A missing index simply means nothing has been stored yet
+        logger.debug("Existing id lookup failed: %s", e)
+        return set()
+    return {hit["_id"] for hit in response["docs"] if hit.get("found")}
+
+
+async def _unindexed_documents(
+    vectorstore: object, batch: Sequence[Document]
+) -> list[Document]:
+    """Drop documents whose id repeats within the batch or already exists in the store."""
+    if not all(doc.id for doc in batch):
+        return list(batch)
+    unique = list({doc.id: doc for doc in batch}.values())
+    existing = await _existing_ids(vectorstore, [doc.id for doc in unique])
+    return [doc for doc in unique if doc.id not in existing]
+
+
+def _document_ids(docs: Sequence[Document]) -> list[str] | None:
+    """Return the ids to write `docs` under, or None when any document lacks one."""
+    ids = [doc.id for doc in docs]
+    return ids if all(ids) else None  # type: ignore[return-value]
+
+
+async def _run_pipeline(producer: Coroutine, consumer: Coroutine) -> None:
+    """Run a producer and a consumer connected by a queue until both finish.
+
+    If either fails, the other is cancelled and the original exception is
+    raised. The producer only enqueues its end-of-stream marker after a
+    normal finish, so a cancelled producer never blocks on a full queue.
+    """
+    tasks = [asyncio.ensure_future(producer), asyncio.ensure_future(consumer)]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()  # type: ignore[misc]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _embedding_pipeline(retriever: VectorStoreRetriever) -> tuple[object, object] | None:
+    """Return the store and its embeddings when they support `_pipelined_add`."""
+    vectorstore = getattr(retriever, "vectorstore", None)
+    embeddings = getattr(vectorstore, "embeddings", None)
+    if embeddings is not None and hasattr(vectorstore, "aadd_embeddings"):
+        return vectorstore, embeddings
+    return None
+
+
+async def _iterate(items: Iterable[T]) -> AsyncIterator[T]:
+    """Yield the items of a regular iterable asynchronously."""
+    for item in items:
+        yield item
+
+
+async def _pipelined_add(
+    vectorstore: object,
+    embeddings: object,
+    batches: AsyncIterable[Sequence[Document]],
+) -> None:
+    """Embed the next batch while the previous one is being written.
+
+    One task computes embeddings and hands them over a small bounded queue to
+    a second task that writes them with `aadd_embeddings`, so the embedding
+    service and the vector store are busy at the same time. `batches` may be
+    produced lazily, e.g. as URLs finish downloading.
+    """
+    queue: asyncio.Queue[tuple[list[Document], list[list[float]]] | None] = (
+        asyncio.Queue(maxsize=2)
+    )
+
+    async def embed() -> None:
+        async for batch in batches:
+            docs = await _unindexed_documents(vectorstore, batch)
+            if docs:
+                vectors = await embeddings.aembed_documents(  # type: ignore[attr-defined]
+                    [doc.page_content for doc in docs]
+                )
+                await queue.put((docs, vectors))
+        await queue.put(None)
+
+    async def insert() -> None:
+        while (item := await queue.get()) is not None:
+            docs, vectors = item
+            await vectorstore.aadd_embeddings(  # type: ignore[attr-defined]
+                list(zip((doc.page_content for doc in docs), vectors)),
+                metadatas=[doc.metadata for doc in docs],
+                ids=_document_ids(docs),
+            )
+
+    await _run_pipeline(embed(), insert())
+
+
+async def add_documents_in_batches(
+    retriever: VectorStoreRetriever,
+    docs: Sequence[Document],
+    batch_size: int,
+    concurrency: int,
+) -> None:
+    """Add documents to the retriever's vector store in fixed-size batches.
+
+    Large single calls to `aadd_documents` degrade or run out of memory on
+    many backends, so the documents are split into batches. Documents with an
+    id are deduplicated and skipped when the store already holds that id, so
+    re-indexing unchanged content costs no embedding calls.
+
+    When the store exposes its embeddings and `aadd_embeddings`, embedding and
+    writing are pipelined across batches. Otherwise at most `concurrency`
+    batches are passed to `aadd_documents` at once.
+
+    Args:
+        retriever (VectorStoreRetriever): The retriever whose store receives the documents.
+        docs (Sequence[Document]): The documents to add.
+        batch_size (int): Maximum number of documents per `aadd_documents` call.
+        concurrency (int): Maximum number of batches added concurrently.
+    """
+    batch_size = max(1, batch_size)
+    batches = [docs[i : i + batch_size] for i in range(0, len(docs), batch_size)]
+    pipeline = _embedding_pipeline(retriever)
+    if pipeline is not None:
+        await _pipelined_add(*pipeline, _iterate(batches))
+        return
+
+    vectorstore = getattr(retriever, "vectorstore", None)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def add_batch(batch: Sequence[Document]) -> None:
+        async with semaphore:
+            new_docs = await _unindexed_documents(vectorstore, batch)
+            if new_docs:
+                ids = _document_ids(new_docs)
+                if ids is None:
+                    await retriever.aadd_documents(new_docs)
+                else:
+                    await retriever.aadd_documents(new_docs, ids=ids)
+
+    await asyncio.gather(*(add_batch(batch) for batch in batches))
 
 
 async def index_docs(
@@ -37,103 +245,146 @@ async def index_docs(
 ) -> dict[str, str]:
     """Asynchronously index documents in the given state using the configured retriever.
 
-    This function takes the documents from the state, ensures they have a user ID,
-    adds them to the retriever's index, and then signals for the documents to be
-    deleted from the state.
+    URL documents (PDFs and web pages) are fetched and validated before being
+    indexed; all other documents are indexed as-is. A single retriever is
+    opened for both, so each ingest pays for one vector store connection.
+    The documents are then signaled for deletion from the state.
 
     Args:
         state (IndexState): The current state containing documents and retriever.
-        config (Optional[RunnableConfig]): Configuration for the indexing process.r
+        config (Optional[RunnableConfig]): Configuration for the indexing process.
     """
     if not config:
         raise ValueError("Configuration required to run index_docs.")
-    with retrieval.make_retriever(config) as retriever:
-        stamped_docs = ensure_docs_have_user_id(state.docs, config)
 
-        await retriever.aadd_documents(stamped_docs)
+    # Split URLs from text documents, checking each document once. URLs are
+    # deduplicated (dict keys keep their order) so each is fetched only once.
+    urls: dict[str, None] = {}
+    text_docs = []
+    for doc in state.docs:
+        content = doc.page_content
+        if content.startswith(_URL_PREFIXES):
+            urls[content.strip()] = None
+        else:
+            text_docs.append(doc)
+    if not urls and not text_docs:
+        return {"docs": "delete"}
+
+    configuration = IndexConfiguration.from_runnable_config(config)
+    async with retrieval.make_retriever_async(config) as retriever:
+        if urls:
+            await index_urls(urls, retriever, config, configuration)
+        if text_docs:
+            await add_documents_in_batches(
+                retriever,
+                ensure_docs_have_user_id(text_docs, config),
+                configuration.index_batch_size,
+                configuration.index_concurrency,
+            )
+    # Searches cached before this run may now miss the new documents
+    retrieval.invalidate_retrieval_cache(configuration.user_id)
     return {"docs": "delete"}
 
 
 async def index_urls(
-    state: IndexState, *, config: RunnableConfig | None
-) -> dict[str, str]:
+    urls: Iterable[str],
+    retriever: VectorStoreRetriever,
+    config: RunnableConfig,
+    configuration: IndexConfiguration,
+) -> None:
     """Index documents from URLs (PDFs and web pages) with content validation.
 
     This function processes URLs to extract content, validates that actual content
     was extracted (not just the URL), and provides clear error messages for failures.
 
     Args:
-        state (IndexState): The current state containing URLs to process.
-        config (Optional[RunnableConfig]): Configuration for the indexing process.
+        urls (Iterable[str]): The URLs to fetch and index; consumed lazily.
+        retriever (VectorStoreRetriever): The retriever whose store receives the documents.
+        config (RunnableConfig): Configuration for the indexing process.
+        configuration (IndexConfiguration): The configuration already resolved from `config`.
+
+    Raises:
+        ValueError: If no content could be extracted from any of the URLs.
     """
-    if not config:
-        raise ValueError("Configuration required to run index_urls.")
+    batch_size = max(1, configuration.index_batch_size)
 
-    # Extract URLs from state
-    urls = []
-    for doc in state.docs:
-        if doc.page_content.startswith(("http://", "https://")):
-            urls.append(doc.page_content.strip())
+    # Validate that documents contain actual content, not just URLs or errors
+    valid_count = 0
+    failed_urls = []
 
-    if urls:
-        # Process URLs to create documents with content validation (now awaited)
-        processed_docs = await create_documents_from_urls(urls)
-        
-        # Validate that documents contain actual content, not just URLs or errors
-        valid_docs = []
-        failed_urls = []
-        
-        for i, doc in enumerate(processed_docs):
-            original_url = urls[i] if i < len(urls) else "Unknown URL"
-            
-            # Check if document contains meaningful content
-            content = doc.page_content.strip()
-            extraction_success = doc.metadata.get("extraction_success", False)
-            
-            # More robust validation
-            if (not extraction_success or 
-                content == original_url or 
-                content.startswith(("Failed", "Error", "Document processing dependencies")) or
-                len(content) < 200):  # Increased threshold for meaningful content
-                failed_urls.append({
-                    "url": original_url,
-                    "error": content if content.startswith(("Failed", "Error")) else "Insufficient content extracted"
-                })
-            else:
-                valid_docs.append(doc)
+    async def valid_batches() -> AsyncIterator[list[Document]]:
+        nonlocal valid_count
+        fetched = create_documents_from_urls(
+            urls, configuration.url_concurrency, configuration.url_cache_dir or None
+        )
+        batch = []
+        # Close the generator (and its in-flight fetches) even when cancelled
+        async with contextlib.aclosing(fetched):
+            async for original_url, doc in fetched:
+                error = _validation_error(original_url, doc)
+                if error is not None:
+                    failed_urls.append({"url": original_url, "error": error})
+                    continue
+                valid_count += 1
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    yield ensure_docs_have_user_id(batch, config)
+                    batch = []
+        if batch:
+            yield ensure_docs_have_user_id(batch, config)
+
+    # Fetching and indexing overlap: each batch is indexed as soon as enough
+    # URLs have finished, so indexing starts before the slowest fetch.
+    pipeline = _embedding_pipeline(retriever)
+    if pipeline is not None:
+        # One embed/write pipeline for all URLs, so it also overlaps across batches
+        async with contextlib.aclosing(valid_batches()) as batches:
+            await _pipelined_add(*pipeline, batches)
+    else:
+        queue: asyncio.Queue[list[Document] | None] = asyncio.Queue(maxsize=1)
+
+        async def produce() -> None:
+            async with contextlib.aclosing(valid_batches()) as batches:
+                async for batch in batches:
+                    await queue.put(batch)
+            await queue.put(None)
+
+        async def consume() -> None:
+            while (batch := await queue.get()) is not None:
+                await add_documents_in_batches(
+                    retriever, batch, batch_size, configuration.index_concurrency
+                )
+
+        await _run_pipeline(produce(), consume())
+
+    if valid_count:
+        logger.info("Successfully indexed %d documents from URLs.", valid_count)
+    
+    # Provide detailed error reporting
+    if failed_urls:
+        error_details = []
+        for failed in failed_urls[:3]:  # Show first 3 failures
+            error_details.append(f"  - {failed['url']}: {failed['error']}")
         
-        # Index valid documents
-        if valid_docs:
-            with retrieval.make_retriever(config) as retriever:
-                stamped_docs = ensure_docs_have_user_id(valid_docs, config)
-                await retriever.aadd_documents(stamped_docs)
-                print(f"Successfully indexed {len(valid_docs)} documents from URLs.")
+        error_msg = (f"Failed to extract content from {len(failed_urls)} URL(s):\n" + 
+                    "\n".join(error_details) + 
+                    ("..." if len(failed_urls) > 3 else "") +
+                    "\n\nPlease verify URLs are accessible and contain extractable content, or upload document text manually.")
+        logger.warning(
+            "URL Processing Error: %s", error_msg, extra={"failed_urls": failed_urls}
+        )
         
-        # Provide detailed error reporting
-        if failed_urls:
-            error_details = []
-            for failed in failed_urls[:3]:  # Show first 3 failures
-                error_details.append(f"  - {failed['url']}: {failed['error']}")
-            
-            error_msg = (f"Failed to extract content from {len(failed_urls)} URL(s):\n" + 
-                        "\n".join(error_details) + 
-                        ("..." if len(failed_urls) > 3 else "") +
-                        "\n\nPlease verify URLs are accessible and contain extractable content, or upload document text manually.")
-            print(f"URL Processing Error: {error_msg}")
-            
-            # If all URLs failed, raise an exception to notify the user
-            if not valid_docs:
-                raise ValueError(f"Could not extract content from any of the provided URLs. {error_msg}")
+        # If all URLs failed, raise an exception to notify the user
+        if not valid_count:
+            raise ValueError(f"Could not extract content from any of the provided URLs. {error_msg}")
+
 
-    return {"docs": "delete"}
 # Define a new graph
 
 
 builder = StateGraph(IndexState, config_schema=IndexConfiguration)
 builder.add_node("index_docs", index_docs)
-builder.add_node("index_urls", index_urls)
-builder.add_edge("__start__", "index_urls")  # Process URLs first
-builder.add_edge("index_urls", "index_docs")  # Then process any remaining docs
+builder.add_edge("__start__", "index_docs")
 # Finally, we compile it!
 # This compiles it into a graph you can invoke and deploy.
 graph = builder.compile()
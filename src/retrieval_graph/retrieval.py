@@ -6,22 +6,49 @@ vector store backends, specifically Elasticsearch, Pinecone, and MongoDB.
 The retrievers support filtering results by user_id to ensure data isolation between users.
 """
 
-import os
 import asyncio
-from contextlib import contextmanager
-from typing import Generator
+import atexit
+import functools
+import hashlib
+import os
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from types import MappingProxyType
+from typing import (
+    Any,
+    AsyncGenerator,
+    Generator,
+    Mapping,
+    get_args,
+    get_type_hints,
+)
 
+from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.runnables import RunnableConfig
 from langchain_core.vectorstores import VectorStoreRetriever
 
-from retrieval_graph.configuration import Configuration, IndexConfiguration
+from retrieval_graph.cache import TTLCache
+from retrieval_graph.configuration import IndexConfiguration
+
+# Name of the Elasticsearch index holding every user's documents
+ELASTIC_INDEX_NAME = "langchain_index"
 
 ## Encoder constructors
 
 
-def make_text_encoder(model: str) -> Embeddings:
-    """Connect to the configured text encoder."""
+def make_text_encoder(model: str, dimensions: int | None = None) -> Embeddings:
+    """Connect to the configured text encoder.
+
+    Encoders are shared: every call with the same provider, model and
+    dimensions returns the same client instance.
+
+    Args:
+        model (str): The embedding model, in the form provider/model-name.
+        dimensions (Optional[int]): Truncate embeddings to this many dimensions,
+            for models that support it. None keeps the model's full size.
+    """
     if not model:
         raise ValueError("Embedding model cannot be empty or None")
     
@@ -33,24 +60,47 @@ def make_text_encoder(model: str) -> Embeddings:
     else:
         provider, model_name = model.split("/", maxsplit=1)
     
+    return _build_text_encoder(provider, model_name, dimensions)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_text_encoder(
+    provider: str, model_name: str, dimensions: int | None = None
+) -> Embeddings:
+    """Construct the encoder client for a provider, model and size, once each."""
     match provider:
         case "google":
             from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
-            return GoogleGenerativeAIEmbeddings(model=model_name)
+            return GoogleGenerativeAIEmbeddings(
+                model=model_name, output_dimensionality=dimensions
+            )
         case _:
             raise ValueError(f"Unsupported embedding provider: {provider}")
 
 
-## Retriever constructors
+@functools.cache
+def _es_classes() -> tuple[type, type]:
+    """Import the Elasticsearch store and client classes on first use."""
+    from elasticsearch import AsyncElasticsearch
+    from langchain_elasticsearch import AsyncElasticsearchStore
 
+    return AsyncElasticsearchStore, AsyncElasticsearch
 
-async def _create_async_elastic_retriever(
-    configuration: IndexConfiguration, embedding_model: Embeddings
-) -> VectorStoreRetriever:
-    """Internal async function to create Elasticsearch retriever."""
-    from langchain_elasticsearch import AsyncElasticsearchStore
-    from elasticsearch import AsyncElasticsearch
+
+@functools.cache
+def _es_serializer_options() -> dict[str, Any]:
+    """Use orjson for Elasticsearch request and response bodies when installed."""
+    try:
+        from elasticsearch.serializer import OrjsonSerializer
+    except ImportError:
+        return {}
+    return {"serializer": OrjsonSerializer()}
+
+
+def _create_elastic_client(configuration: IndexConfiguration) -> Any:
+    """Create an async Elasticsearch client for the configured provider."""
+    _, AsyncElasticsearch = _es_classes()
 
     connection_options = {}
     if configuration.retriever_provider == "elastic-local":
@@ -63,98 +113,305 @@ async def _create_async_elastic_retriever(
     else:
         connection_options = {"api_key": os.environ["ELASTICSEARCH_API_KEY"]}
 
-    # Create async Elasticsearch client
-    es_client = AsyncElasticsearch(
+    return AsyncElasticsearch(
         hosts=[os.environ["ELASTICSEARCH_URL"]],
-        **connection_options
+        **connection_options,
+        **_es_serializer_options(),
     )
 
-    # Create AsyncElasticsearchStore
+
+def _create_elastic_retriever(
+    configuration: IndexConfiguration, embedding_model: Embeddings, es_client: Any
+) -> VectorStoreRetriever:
+    """Create an Elasticsearch retriever on `es_client`, filtered to the configured user."""
+    AsyncElasticsearchStore, _ = _es_classes()
     vstore = AsyncElasticsearchStore(
         es_connection=es_client,
-        index_name="langchain_index",
+        index_name=ELASTIC_INDEX_NAME,
         embedding=embedding_model,
     )
 
-    search_kwargs = configuration.search_kwargs.copy()
+    search_kwargs = _build_search_kwargs(
+        configuration.user_id, configuration.search_kwargs
+    )
+    return vstore.as_retriever(search_kwargs=dict(search_kwargs))
+
+
+def _build_search_kwargs(
+    user_id: str, base_kwargs: Mapping[str, Any]
+) -> Mapping[str, Any]:
+    """Return the search kwargs for a user as a read-only mapping.
+
+    Results for hashable settings are memoized; settings holding lists (such as
+    a custom filter) are rebuilt on each call.
+    """
+    items = tuple(sorted(base_kwargs.items()))
+    try:
+        return _frozen_search_kwargs(user_id, items)
+    except TypeError:
+        return _frozen_search_kwargs.__wrapped__(user_id, items)
+
+
+@functools.lru_cache(maxsize=128)
+def _frozen_search_kwargs(
+    user_id: str, items: tuple[tuple[str, Any], ...]
+) -> Mapping[str, Any]:
+    """Add the user filter and default k to the given search kwargs."""
+    search_kwargs = dict(items)
+
+    # Add user_id filter for data isolation, without touching the caller's list
+    search_kwargs["filter"] = [
+        *search_kwargs.get("filter", ()),
+        {"term": {"metadata.user_id": user_id}},
+    ]
 
-    # Add user_id filter for data isolation
-    search_filter = search_kwargs.setdefault("filter", [])
-    search_filter.append({"term": {"metadata.user_id": configuration.user_id}})
-    
     # Set default k to limit retrieved documents (default to 1 as specified)
-    if "k" not in search_kwargs:
-        search_kwargs["k"] = 1
-    
-    return vstore.as_retriever(search_kwargs=search_kwargs)
+    search_kwargs.setdefault("k", 1)
+    return MappingProxyType(search_kwargs)
+
+
+class _LoopClients:
+    """The Elasticsearch clients and retrievers shared on one event loop.
+
+    The async client keeps a connection pool bound to one loop, so each loop
+    gets one client per provider. Retrievers on top of it only hold the
+    per-user search settings, so they are cheap and kept in a bounded LRU.
+    """
+
+    def __init__(self) -> None:
+        self.clients: dict[str, Any] = {}
+        self.retrievers: OrderedDict[tuple, VectorStoreRetriever] = OrderedDict()
+        self.closer: AsyncGenerator[None, None] | None = None
+
+
+# Per-user retrievers kept for each event loop
+_RETRIEVER_CACHE_SIZE = 256
+
+_LOOP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClients]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def _close_at_loop_shutdown(shared: _LoopClients) -> AsyncGenerator[None, None]:
+    """Close the clients in `shared` when the loop finalizes its async generators.
+
+    Started once per loop, this generator stays suspended until
+    ``loop.shutdown_asyncgens()`` closes it, which ``asyncio.run`` does while
+    the loop can still run the clients' close coroutines.
+    """
+    try:
+        yield
+    finally:
+        _LOOP_CLIENTS.pop(asyncio.get_running_loop(), None)
+        await _close_loop_clients(shared)
+
+
+@atexit.register
+def _close_cached_clients() -> None:
+    """Close pooled clients at interpreter exit, where their loop can still run."""
+    for loop in list(_LOOP_CLIENTS):
+        if loop.is_closed() or loop.is_running():
+            continue
+        loop.run_until_complete(_close_loop_clients(_LOOP_CLIENTS.pop(loop)))
+
+
+async def _close_loop_clients(shared: _LoopClients) -> None:
+    """Close every client in `shared`, ignoring errors."""
+    for client in shared.clients.values():
+        try:
+            await client.close()
+        except Exception:
+            # Ignore cleanup errors
+            pass
+
+
+def _running_loop() -> asyncio.AbstractEventLoop | None:
+    """Return the running event loop, or None when called outside of one."""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _cached_elastic_retriever(
+    loop: asyncio.AbstractEventLoop,
+    configuration: IndexConfiguration,
+    embedding_model: Embeddings,
+) -> VectorStoreRetriever:
+    """Return the retriever for these settings on `loop`, sharing the loop's client."""
+    shared = _LOOP_CLIENTS.get(loop)
+    if shared is None:
+        shared = _LOOP_CLIENTS[loop] = _LoopClients()
+        # Advancing the generator registers it with the loop's shutdown hooks
+        shared.closer = _close_at_loop_shutdown(shared)
+        asyncio.ensure_future(shared.closer.__anext__(), loop=loop)
+    key = (
+        configuration.retriever_provider,
+        configuration.user_id,
+        configuration.embedding_model,
+        configuration.embedding_dimensions,
+        repr(configuration.search_kwargs),
+    )
+    retriever = shared.retrievers.get(key)
+    if retriever is not None:
+        shared.retrievers.move_to_end(key)
+        return retriever
+    client = shared.clients.get(configuration.retriever_provider)
+    if client is None:
+        client = shared.clients[configuration.retriever_provider] = (
+            _create_elastic_client(configuration)
+        )
+    retriever = shared.retrievers[key] = _create_elastic_retriever(
+        configuration, embedding_model, client
+    )
+    if len(shared.retrievers) > _RETRIEVER_CACHE_SIZE:
+        shared.retrievers.popitem(last=False)
+    return retriever
 
 
 @contextmanager
 def make_elastic_retriever(
     configuration: IndexConfiguration, embedding_model: Embeddings
 ) -> Generator[VectorStoreRetriever, None, None]:
-    """Configure this agent to connect to a specific elastic index using async operations."""
-    
-    # Run the async creation in a thread to avoid blocking
-    async def create_retriever():
-        return await _create_async_elastic_retriever(configuration, embedding_model)
-    
-    # Use asyncio.to_thread to run the async operation without blocking
-    try:
-        # Get or create event loop
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # If we're already in an async context, we need to use a different approach
-            # This creates the retriever using the async method but wraps it for sync use
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, create_retriever())
-                retriever = future.result(timeout=30)
-        else:
-            retriever = loop.run_until_complete(create_retriever())
-    except RuntimeError:
-        # Fallback: create a new event loop
-        retriever = asyncio.run(create_retriever())
-    
+    """Configure this agent to connect to a specific elastic index using async operations.
+
+    Inside an event loop the client, and with it the connection pool, is
+    shared by every user on that loop, and the retriever for each user and
+    search settings is reused afterwards.
+    Outside of one, a fresh retriever is created and closed after use.
+    """
+    loop = _running_loop()
+    if loop is not None:
+        yield _cached_elastic_retriever(loop, configuration, embedding_model)
+        return
+
+    retriever = _create_elastic_retriever(
+        configuration, embedding_model, _create_elastic_client(configuration)
+    )
     try:
         yield retriever
     finally:
-        # Clean up the retriever's connection if it has one
-        if hasattr(retriever.vectorstore, 'client') and hasattr(retriever.vectorstore.client, 'close'):
-            try:
-                # Try to close the client properly
-                if asyncio.iscoroutinefunction(retriever.vectorstore.client.close):
-                    try:
-                        loop = asyncio.get_event_loop()
-                        if not loop.is_closed():
-                            loop.run_until_complete(retriever.vectorstore.client.close())
-                    except RuntimeError:
-                        asyncio.run(retriever.vectorstore.client.close())
-                else:
-                    retriever.vectorstore.client.close()
-            except Exception:
-                # Ignore cleanup errors
-                pass
+        try:
+            asyncio.run(retriever.vectorstore.client.close())
+        except Exception:
+            # Ignore cleanup errors
+            pass
 
 
-@contextmanager
-def make_retriever(
+@asynccontextmanager
+async def make_elastic_retriever_async(
+    configuration: IndexConfiguration, embedding_model: Embeddings
+) -> AsyncGenerator[VectorStoreRetriever, None]:
+    """Connect to a specific elastic index from within the running event loop."""
+    yield _cached_elastic_retriever(
+        asyncio.get_running_loop(), configuration, embedding_model
+    )
+
+
+# Providers accepted by IndexConfiguration.retriever_provider
+_VALID_PROVIDERS = frozenset(
+    get_args(get_type_hints(IndexConfiguration)["retriever_provider"])
+)
+
+
+def _unrecognized_provider(configuration: IndexConfiguration) -> ValueError:
+    """Build the error raised for an unsupported retriever_provider."""
+    return ValueError(
+        "Unrecognized retriever_provider in configuration. "
+        f"Expected one of: {', '.join(sorted(_VALID_PROVIDERS))}\n"
+        f"Got: {configuration.retriever_provider}"
+    )
+
+
+def _resolve_retriever_settings(
     config: RunnableConfig,
-) -> Generator[VectorStoreRetriever, None, None]:
-    """Create a retriever for the agent, based on the current configuration."""
+) -> tuple[IndexConfiguration, Embeddings]:
+    """Resolve the index configuration and encoder for a retriever."""
     configuration = IndexConfiguration.from_runnable_config(config)
-    embedding_model = make_text_encoder(configuration.embedding_model)
+    # Fail before building an encoder for a provider that cannot be used
+    if configuration.retriever_provider not in _VALID_PROVIDERS:
+        raise _unrecognized_provider(configuration)
+    embedding_model = make_text_encoder(
+        configuration.embedding_model, configuration.embedding_dimensions
+    )
     user_id = configuration.user_id
     if not user_id:
         raise ValueError("Please provide a valid user_id in the configuration.")
+    return configuration, embedding_model
+
+
+@contextmanager
+def make_retriever(
+    config: RunnableConfig,
+) -> Generator[VectorStoreRetriever, None, None]:
+    """Create a retriever for the agent, based on the current configuration."""
+    configuration, embedding_model = _resolve_retriever_settings(config)
     
     match configuration.retriever_provider:
         case "elastic-local":
             with make_elastic_retriever(configuration, embedding_model) as retriever:
                 yield retriever
         case _:
-            raise ValueError(
-                "Unrecognized retriever_provider in configuration. "
-                f"Expected one of: {', '.join(Configuration.__annotations__['retriever_provider'].__args__)}\n"
-                f"Got: {configuration.retriever_provider}"
-            )
\ No newline at end of file
+            raise _unrecognized_provider(configuration)
+
+
+@asynccontextmanager
+async def make_retriever_async(
+    config: RunnableConfig,
+) -> AsyncGenerator[VectorStoreRetriever, None]:
+    """Create a retriever for use inside the graph's event loop.
+
+    Graph nodes should prefer this over `make_retriever`, which also has to
+    support callers without a running loop.
+    """
+    configuration, embedding_model = _resolve_retriever_settings(config)
+
+    match configuration.retriever_provider:
+        case "elastic-local":
+            async with make_elastic_retriever_async(
+                configuration, embedding_model
+            ) as retriever:
+                yield retriever
+        case _:
+            raise _unrecognized_provider(configuration)
+
+
+# Recent search results, keyed by user, search settings and query digest;
+# only used when retrieval_cache_ttl is set.
+_RESULTS = TTLCache(max_entries=1024)
+
+
+async def aretrieve(query: str, config: RunnableConfig) -> list[Document]:
+    """Retrieve documents for a query, reusing recent results when enabled.
+
+    Args:
+        query (str): The search query.
+        config (RunnableConfig): The configuration selecting the user and retriever.
+
+    Returns:
+        list[Document]: The retrieved documents.
+    """
+    configuration = IndexConfiguration.from_runnable_config(config)
+    key = None
+    if configuration.retrieval_cache_ttl > 0:
+        key = (
+            configuration.user_id,
+            configuration.embedding_model,
+            configuration.embedding_dimensions,
+            repr(configuration.search_kwargs),
+            hashlib.blake2b(query.encode(), digest_size=16).digest(),
+        )
+        cached = _RESULTS.get(key)
+        if cached is not None:
+            return list(cached)
+
+    async with make_retriever_async(config) as retriever:
+        docs = await retriever.ainvoke(query, config)
+    if key is not None:
+        _RESULTS.set(key, tuple(docs), configuration.retrieval_cache_ttl)
+    return docs
+
+
+def invalidate_retrieval_cache(user_id: str) -> None:
+    """Forget cached search results for a user, e.g. after indexing new documents."""
+    _RESULTS.discard_where(lambda key: key[0] == user_id)
@@ -0,0 +1,26 @@
+"""Structured output schemas for the graph's model calls.
+
+These live apart from the graph so that offline tools, such as the message
+batch classifier, can reuse them without building the graph.
+"""
+
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict
+
+
+class QueryClassification(BaseModel):
+    """Classification of user query into subject areas."""
+
+    model_config = ConfigDict(frozen=True)
+
+    subject: Literal["science", "history", "literature", "general"]
+
+
+class CritiqueDecision(BaseModel):
+    """Decision from critique agent whether to retry or respond."""
+
+    model_config = ConfigDict(frozen=True)
+
+    decision: Literal["respond", "retry", "improve_query"]
+    reasoning: str
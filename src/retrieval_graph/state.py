@@ -20,6 +20,7 @@ these state management operations.
 """
 
 import uuid
+from collections import deque
 from dataclasses import dataclass, field
 from typing import Annotated, Any, Literal, Sequence, Union
 
@@ -133,19 +134,30 @@ class InputState:
 
 # This is the primary state of your agent, where you can store any information
 
+MAX_RETRIEVED_DOCS = 5
+"""Maximum number of retrieved documents kept in state to bound prompt size."""
+
 
 @dataclass(kw_only=True)
 class State(InputState):
     """The state of your graph / agent."""
 
-    retrieved_docs: list[Document] = field(default_factory=list)
-    """Populated by the retriever. This is a list of documents that the agent can reference."""
+    retrieved_docs: deque[Document] = field(
+        default_factory=lambda: deque(maxlen=MAX_RETRIEVED_DOCS)
+    )
+    """Populated by the retriever. Holds the most recent documents that the agent can reference."""
+
+    original_question: str | None = field(default=None)
+    """The first user question, extracted once by the classifier."""
 
     classification: str | None = field(default=None)
     """Stores the classified subject area (science/history/literature/general)"""
     
     agent_response: str | None = field(default=None)
     """Stores the response from the specialist agent."""
+
+    has_tool_calls: bool = field(default=False)
+    """Whether the last specialist agent response requested tool calls."""
     
     critique_decision: str | None = field(default=None)
     """Stores the decision from critique agent (respond/retry/improve_query)."""
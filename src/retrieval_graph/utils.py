@@ -5,13 +5,29 @@ and other common operations in project.
 
 Functions:
     get_message_text: Extract text content from various message formats.
+    normalize_vector: Scale an embedding to unit length.
     format_docs: Convert documents to an xml-formatted string with content limits.
-    estimate_tokens: Estimate token count for text (rough approximation).
+    format_docs_safe_parts: Convert documents to xml-formatted strings, one per document.
+    format_doc_digests: Convert documents to compact, canonically ordered digests.
+    estimate_tokens: Estimate token count for text (BPE when tiktoken is available).
     truncate_to_token_limit: Truncate text to stay within token limits.
 """
 
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
 import logging
-from typing import List
+import math
+import multiprocessing
+import os
+import random
+import re
+import tempfile
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterable, Sequence
+from xml.sax.saxutils import quoteattr
 
 from langchain.chat_models import init_chat_model
 from langchain_core.documents import Document
@@ -31,11 +47,46 @@ try:
 except ImportError:
     DOCUMENT_PROCESSING_AVAILABLE = False
 
+# Prefixes of the placeholder content produced when extraction fails
+EXTRACTION_ERROR_PREFIXES = ("Failed", "Error", "Document processing dependencies")
+
+
+def normalize_vector(vector: Sequence[float]) -> list[float]:
+    """Scale a vector to unit length so dot products are cosine similarities.
+
+    Args:
+        vector (Sequence[float]): The vector to normalize.
+
+    Returns:
+        list[float]: The unit-length vector (the input unchanged if it is all zeros).
+    """
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+@functools.cache
+def _get_encoding() -> Any:
+    """Load the cl100k_base tokenizer once, or return None if it is unavailable."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken is not installed or its encoding file could not be downloaded
+        return None
+
+
+# Below this length the per-call tokenizer overhead outweighs an exact count
+_SHORT_TEXT_CHARS = 64
+
 
 def estimate_tokens(text: str) -> int:
     """Estimate the number of tokens in a text string.
     
-    This is a rough approximation: 1 token ≈ 4 characters for English text.
+    Uses the cl100k_base BPE tokenizer when tiktoken is available, and falls
+    back to a rough approximation (1 token ≈ 4 characters) otherwise. Short
+    ASCII strings such as markup and metadata are estimated at 3 characters
+    per token, which slightly over-counts but skips the tokenizer call.
     
     Args:
         text (str): The text to estimate tokens for.
@@ -45,7 +96,64 @@ def estimate_tokens(text: str) -> int:
     """
     if not text:
         return 0
-    return len(text) // 4
+    if len(text) < _SHORT_TEXT_CHARS and text.isascii():
+        return -(-len(text) // 3)
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode_ordinary(text))
+
+
+# Upper bound on the tokens of format_docs_safe's truncation note
+_TRUNCATION_NOTE_TOKENS = 32
+_HEAVY_TRUNCATION_MARKER = "... [HEAVILY TRUNCATED DUE TO SIZE]"
+
+
+# Token counts of recently formatted document contents, least recently used first
+_TOKEN_COUNTS: "OrderedDict[str, int]" = OrderedDict()
+_TOKEN_COUNTS_SIZE = 256
+
+
+def _content_token_counts(contents: Sequence[str]) -> list[int]:
+    """Count the tokens of several contents; documents recur across graph nodes.
+
+    Contents without a cached count are encoded together in one batch call,
+    which tiktoken spreads over native threads.
+    """
+    missing = [c for c in dict.fromkeys(contents) if c not in _TOKEN_COUNTS]
+    if missing:
+        encoding = _get_encoding()
+        if encoding is not None and len(missing) > 1:
+            counts = map(len, encoding.encode_ordinary_batch(missing))
+        else:
+            counts = map(estimate_tokens, missing)
+        _TOKEN_COUNTS.update(zip(missing, counts))
+    result = []
+    for content in contents:
+        _TOKEN_COUNTS.move_to_end(content)
+        result.append(_TOKEN_COUNTS[content])
+    while len(_TOKEN_COUNTS) > _TOKEN_COUNTS_SIZE:
+        _TOKEN_COUNTS.popitem(last=False)
+    return result
+
+
+def _content_tokens(content: str) -> int:
+    """Count the tokens of one content string, using the shared count cache."""
+    return _content_token_counts((content,))[0]
+
+
+def _token_prefix(text: str, max_tokens: int) -> str:
+    """Return the start of `text` that fits in `max_tokens` tokens.
+
+    Without a tokenizer, cuts at 90% of the estimated character budget for safety.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:int(max_tokens * 4 * 0.9)]
+    return encoding.decode(encoding.encode_ordinary(text)[:max_tokens])
+
+
+_TRUNCATION_MARKER = "\n\n... [CONTENT TRUNCATED TO PREVENT TOKEN OVERFLOW]"
 
 
 def truncate_to_token_limit(text: str, max_tokens: int = 150000) -> str:
@@ -60,18 +168,19 @@ def truncate_to_token_limit(text: str, max_tokens: int = 150000) -> str:
     """
     if not text:
         return text
-        
-    estimated_tokens = estimate_tokens(text)
-    if estimated_tokens <= max_tokens:
+
+    budget = max(max_tokens - estimate_tokens(_TRUNCATION_MARKER), 0)
+    encoding = _get_encoding()
+    if encoding is not None:
+        # Encode once and slice the token IDs instead of counting, then re-encoding
+        tokens = encoding.encode_ordinary(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:budget]) + _TRUNCATION_MARKER
+
+    if estimate_tokens(text) <= max_tokens:
         return text
-    
-    # Calculate how much to truncate (with some safety margin)
-    target_chars = max_tokens * 4 * 0.9  # 90% of estimated limit for safety
-    if len(text) > target_chars:
-        truncated = text[:int(target_chars)]
-        return truncated + "\n\n... [CONTENT TRUNCATED TO PREVENT TOKEN OVERFLOW]"
-    
-    return text
+    return _token_prefix(text, budget) + _TRUNCATION_MARKER
 
 
 def get_message_text(msg: AnyMessage) -> str:
@@ -100,8 +209,35 @@ def get_message_text(msg: AnyMessage) -> str:
     elif isinstance(content, dict):
         return content.get("text", "")
     else:
-        txts = [c if isinstance(c, str) else (c.get("text") or "") for c in content]
-        return "".join(txts).strip()
+        return "".join(
+            [c if isinstance(c, str) else (c.get("text") or "") for c in content]
+        ).strip()
+
+
+def _render_meta(metadata: dict | None) -> str:
+    """Render document metadata as the attribute part of a <document> tag.
+
+    Retrieved documents are formatted again on every agent and critique call,
+    so renderings of hashable metadata are cached.
+    """
+    if not metadata:
+        return ""
+    # Types are part of the key so equal values like 1 and True render apart
+    items = tuple((k, v, type(v)) for k, v in metadata.items())
+    try:
+        return _render_meta_items(items)
+    except TypeError:
+        # Unhashable values (e.g. lists) are rendered without the cache
+        return _render_meta_items.__wrapped__(items)
+
+
+@functools.lru_cache(maxsize=1024)
+def _render_meta_items(items: tuple[tuple[str, Any, type], ...]) -> str:
+    """Render (key, value, type) items as ` key="value"` attributes, preceded by a space."""
+    meta = "".join(f" {k}={quoteattr(str(v))}" for k, v, _ in items)
+    if meta:
+        meta = f" {meta}"
+    return meta
 
 
 def _format_doc(doc: Document, max_content_length: int = 2000) -> str:
@@ -114,13 +250,13 @@ def _format_doc(doc: Document, max_content_length: int = 2000) -> str:
     Returns:
         str: The formatted document as an XML string.
     """
-    metadata = doc.metadata or {}
-    meta = "".join(f" {k}={v!r}" for k, v in metadata.items())
-    if meta:
-        meta = f" {meta}"
+    return _render_doc(_render_meta(doc.metadata), doc.page_content, max_content_length)
+
 
+@functools.lru_cache(maxsize=512)
+def _render_doc(meta: str, content: str, max_content_length: int) -> str:
+    """Render one document's XML; cached by value, since documents recur across calls."""
     # Truncate content if it's too long
-    content = doc.page_content
     if len(content) > max_content_length:
         content = content[:max_content_length] + "... [TRUNCATED]"
 
@@ -142,63 +278,79 @@ def format_docs_safe(docs: list[Document] | None, max_total_tokens: int = 50000)
     Returns:
         str: Formatted documents within token limits.
     """
+    return "".join(format_docs_safe_parts(docs, max_total_tokens))
+
+
+def format_docs_safe_parts(
+    docs: list[Document] | None, max_total_tokens: int = 50000
+) -> list[str]:
+    """Format documents like `format_docs_safe`, split into one string per document.
+
+    Joining the parts gives the output of `format_docs_safe`. The last part is
+    the closing markup. Prompts can send each part as its own content block,
+    so a leading run of unchanged documents still matches the provider's
+    prompt cache when more are added.
+
+    Args:
+        docs (Optional[list[Document]]): Documents to format.
+        max_total_tokens (int): Maximum total tokens for all documents (default: 50000).
+
+    Returns:
+        list[str]: One part per document plus the closing part, or a single part
+        if nothing was retrieved.
+    """
     if not docs:
-        return "<documents></documents>"
+        return ["<documents></documents>"]
     
-    formatted_docs = []
-    total_tokens = 0
+    parts = []
+    # The running total includes the enclosing markup and room for the
+    # truncation note, so it bounds the final size without a re-count
+    total_tokens = _content_tokens("<documents>\n\n</documents>") + _TRUNCATION_NOTE_TOKENS
     max_doc_tokens = 8000  # Max tokens per document
+    content_tokens = _content_token_counts([doc.page_content for doc in docs])
     
     for i, doc in enumerate(docs):
         # Truncate individual document content to prevent any single doc from being too large
         content = doc.page_content
-        doc_tokens = estimate_tokens(content)
+        doc_tokens = content_tokens[i]
         
         if doc_tokens > max_doc_tokens:
             # Truncate this document
-            target_chars = max_doc_tokens * 4 * 0.9
-            content = content[:int(target_chars)] + "... [DOCUMENT TRUNCATED]"
-            doc_tokens = estimate_tokens(content)
+            content = _token_prefix(content, max_doc_tokens) + "... [DOCUMENT TRUNCATED]"
+            doc_tokens = _content_tokens(content)
+        
+        # The content is already counted; add only the markup around it
+        meta = _render_meta(doc.metadata)
+        markup_tokens = _content_tokens(f"<document{meta}>\n\n</document>") + 1
         
         # Check if adding this document would exceed our total limit
-        if total_tokens + doc_tokens > max_total_tokens:
+        if total_tokens + doc_tokens + markup_tokens > max_total_tokens:
             if i == 0:
                 # If even the first document would exceed limits, truncate it more aggressively
-                remaining_tokens = max_total_tokens - 1000  # Leave room for XML markup
-                target_chars = remaining_tokens * 4 * 0.9
-                content = doc.page_content[:int(target_chars)] + "... [HEAVILY TRUNCATED DUE TO SIZE]"
+                # to exactly the budget left after the markup already counted
+                remaining_tokens = max(
+                    max_total_tokens - total_tokens - markup_tokens - estimate_tokens(_HEAVY_TRUNCATION_MARKER), 0
+                )
+                content = _token_prefix(doc.page_content, remaining_tokens) + _HEAVY_TRUNCATION_MARKER
+                doc_tokens = estimate_tokens(content)
             else:
                 # Stop adding documents, we've reached our limit
                 break
         
-        # Format this document
-        metadata = doc.metadata or {}
-        meta = "".join(f" {k}={v!r}" for k, v in metadata.items())
-        if meta:
-            meta = f" {meta}"
-        
-        formatted_doc = f"<document{meta}>\n{content}\n</document>"
-        formatted_docs.append(formatted_doc)
-        total_tokens += estimate_tokens(formatted_doc)
-    
-    # Create the final result
-    formatted = "\n".join(formatted_docs)
+        # Each part carries its own separator so the parts join into the full result
+        parts.append(f"{'<documents>' if i == 0 else ''}\n<document{meta}>\n{content}\n</document>")
+        total_tokens += doc_tokens + markup_tokens
     
     # Add truncation note if needed
     truncation_note = ""
-    if len(formatted_docs) < len(docs):
-        truncation_note = f"\n<!-- Note: Showing {len(formatted_docs)} of {len(docs)} documents (others truncated to prevent token overflow) -->"
-    
-    result = f"""<documents>
-{formatted}{truncation_note}
-</documents>"""
-    
-    # Final safety check
-    if estimate_tokens(result) > max_total_tokens:
-        # Emergency truncation
-        result = truncate_to_token_limit(result, max_total_tokens)
+    if len(parts) < len(docs):
+        truncation_note = f"\n<!-- Note: Showing {len(parts)} of {len(docs)} documents (others truncated to prevent token overflow) -->"
     
-    return result
+    # The closing markup is a separate final part
+    parts.append(f"{truncation_note}\n</documents>")
+    return parts
+
+
 def format_docs(docs: list[Document] | None, max_content_length: int = 2000, max_total_docs: int = 3) -> str:
     """Format a list of documents as XML with content and document limits.
 
@@ -231,24 +383,69 @@ def format_docs(docs: list[Document] | None, max_content_length: int = 2000, max
     if not docs:
         return "<documents></documents>"
     
+    # Collect every fragment and join once, instead of joining the documents
+    # and then copying that string again into the outer template
+    parts = ["<documents>"]
     # Limit the number of documents to prevent token overflow
-    limited_docs = docs[:max_total_docs]
-    
-    formatted = "\n".join(_format_doc(doc, max_content_length) for doc in limited_docs)
+    for doc in docs[:max_total_docs]:
+        parts.append("\n")
+        parts.append(_format_doc(doc, max_content_length))
     
     # Add a note if we had to truncate documents
-    truncation_note = ""
     if len(docs) > max_total_docs:
-        truncation_note = f"\n<!-- Note: Showing {max_total_docs} of {len(docs)} documents to prevent token overflow -->"
+        parts.append(f"\n<!-- Note: Showing {max_total_docs} of {len(docs)} documents to prevent token overflow -->")
     
-    return f"""<documents>
-{formatted}{truncation_note}
-</documents>"""
+    parts.append("\n</documents>")
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=512)
+def _doc_digest(content: str, source: str, title: str, max_chars: int) -> str:
+    """Render one document's compact digest; cached by its content and source."""
+    if len(content) > max_chars:
+        content = content[:max_chars] + "... [TRUNCATED]"
+    return f"<document source={quoteattr(source)} title={quoteattr(title)}>\n{content}\n</document>"
+
+
+def format_doc_digests(docs: Sequence[Document] | None, max_chars: int = 1000) -> str:
+    """Format documents as compact, canonically ordered digests.
+
+    Each document is reduced to its source, title and the first `max_chars`
+    characters of content, rendered once and cached. Digests are sorted by
+    source and content rather than retrieval order, so queries that retrieve
+    overlapping documents produce identical prompt text for the overlap.
+
+    Args:
+        docs (Optional[Sequence[Document]]): The documents to format.
+        max_chars (int): Maximum content characters per document (default: 1000).
+
+    Returns:
+        str: The digests wrapped in a <documents> element.
+    """
+    if not docs:
+        return "<documents></documents>"
+    entries = sorted(
+        (
+            str(doc.metadata.get("source", "")),
+            doc.page_content,
+            str(doc.metadata.get("title", "")),
+        )
+        for doc in docs
+    )
+    digests = "\n".join(
+        _doc_digest(content, source, title, max_chars)
+        for source, content, title in entries
+    )
+    return f"<documents>\n{digests}\n</documents>"
 
 
+@functools.lru_cache(maxsize=16)
 def load_chat_model(fully_specified_name: str) -> BaseChatModel:
     """Load a chat model from a fully specified name.
 
+    Models are cached per name, so every caller shares one client and its
+    HTTP connection pool.
+
     Args:
         fully_specified_name (str): String in the format 'provider/model'.
     """
@@ -260,11 +457,267 @@ def load_chat_model(fully_specified_name: str) -> BaseChatModel:
     return init_chat_model(model, model_provider=provider)
 
 
-async def extract_text_from_pdf_url(pdf_url: str) -> str:
+# Longest a single request, including its download, may take
+_FETCH_TOTAL_SECONDS = 300
+
+
+def _fetch_timeout() -> "aiohttp.ClientTimeout":
+    """Bound connection setup, stalled reads and the overall time of each request.
+
+    The total cap is generous enough for large PDFs but stops a server that
+    trickles bytes just fast enough to dodge the read timeout from holding a
+    fetch slot indefinitely.
+    """
+    return aiohttp.ClientTimeout(
+        total=_FETCH_TOTAL_SECONDS, sock_connect=10, sock_read=30
+    )
+
+
+# PDFs are compressed internally, so ask for them as-is rather than gzip-wrapped.
+# Pages keep aiohttp's default Accept-Encoding, which adds br when Brotli is installed.
+_PDF_HEADERS = {"Accept-Encoding": "identity"}
+
+# Statuses worth retrying: rate limiting and transient server or gateway errors
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_FETCH_ATTEMPTS = 3
+
+
+@contextlib.asynccontextmanager
+async def _get_with_retries(
+    session: "aiohttp.ClientSession", url: str, **kwargs: Any
+) -> "AsyncIterator[aiohttp.ClientResponse]":
+    """GET a URL, retrying connection failures and transient statuses with backoff.
+
+    Waits 0.2 s, then 0.4 s, between attempts, each stretched by random
+    jitter so that retries against one host do not arrive in lockstep. The
+    last attempt's response is yielded whatever its status.
+    """
+    for attempt in range(_FETCH_ATTEMPTS):
+        last_attempt = attempt == _FETCH_ATTEMPTS - 1
+        try:
+            response = await session.get(url, **kwargs)
+        except (TimeoutError, aiohttp.ClientConnectionError):
+            if last_attempt:
+                raise
+        else:
+            if last_attempt or response.status not in _RETRY_STATUSES:
+                break
+            response.release()
+        await asyncio.sleep(0.2 * 2**attempt * (1 + random.random()))
+    async with response:
+        yield response
+
+
+@contextlib.asynccontextmanager
+async def _client_session(
+    session: "aiohttp.ClientSession | None",
+) -> "AsyncIterator[aiohttp.ClientSession]":
+    """Use the given HTTP session, or open a short-lived one if there is none."""
+    if session is not None:
+        yield session
+        return
+    async with aiohttp.ClientSession(timeout=_fetch_timeout()) as own_session:
+        yield own_session
+
+
+# Upper bound on PDF extraction worker processes
+_PDF_WORKERS = 4
+
+
+def _pdf_worker_count() -> int:
+    """Return the number of PDF extraction worker processes."""
+    return min(_PDF_WORKERS, os.cpu_count() or 1)
+
+
+@functools.cache
+def _pdf_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """Create the worker processes for PDF text extraction on first use.
+
+    Workers are started from a forkserver (or spawned where that is
+    unavailable) rather than forked, since forking a process that already
+    runs server threads can copy held locks into the child. Like any
+    non-fork pool, scripts using it need an ``if __name__ == "__main__"``
+    guard. The pool is kept small so extraction can't crowd out the server.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    method = "forkserver" if "forkserver" in methods else "spawn"
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=_pdf_worker_count(),
+        mp_context=multiprocessing.get_context(method),
+    )
+
+
+# PDFs larger than this are spooled to a temporary file while downloading
+_PDF_SPOOL_BYTES = 8 << 20
+# PDFs larger than this are rejected rather than downloaded
+_PDF_MAX_BYTES = 256 << 20
+
+
+def _open_spool() -> Any:
+    """Create the temporary file a large PDF is spooled to."""
+    return tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+
+
+def _discard_spool(spool: Any) -> None:
+    """Close and delete a partially written spool file."""
+    spool.close()
+    os.unlink(spool.name)
+
+
+async def _spool_pdf(response: "aiohttp.ClientResponse") -> "bytes | str":
+    """Download a PDF in chunks, moving it to a temporary file once it is large.
+
+    Returns the bytes of a small PDF, or the path of the temporary file
+    holding a large one; the caller deletes that file. A response that
+    announces a large Content-Length goes to disk from the first chunk. File
+    operations run in a thread so disk I/O does not stall the event loop.
+
+    Raises:
+        ValueError: If the PDF is larger than `_PDF_MAX_BYTES`.
+    """
+    if (response.content_length or 0) > _PDF_MAX_BYTES:
+        raise ValueError(f"PDF exceeds {_PDF_MAX_BYTES} bytes")
+    buffer = bytearray()
+    spool = None
+    size = 0
+    try:
+        if (response.content_length or 0) > _PDF_SPOOL_BYTES:
+            spool = await asyncio.to_thread(_open_spool)
+        async for chunk in response.content.iter_chunked(64 << 10):
+            size += len(chunk)
+            if size > _PDF_MAX_BYTES:
+                raise ValueError(f"PDF exceeds {_PDF_MAX_BYTES} bytes")
+            if spool is not None:
+                await asyncio.to_thread(spool.write, chunk)
+                continue
+            buffer += chunk
+            if len(buffer) > _PDF_SPOOL_BYTES:
+                spool = await asyncio.to_thread(_open_spool)
+                await asyncio.to_thread(spool.write, buffer)
+                buffer = bytearray()
+    except BaseException:
+        if spool is not None:
+            await asyncio.to_thread(_discard_spool, spool)
+        raise
+    if spool is None:
+        return bytes(buffer)
+    await asyncio.to_thread(spool.close)
+    return spool.name
+
+
+def _pdfium_page_text(pdf: Any, index: int) -> str:
+    """Extract one page's text with pypdfium2, releasing the native handles right away."""
+    page = pdf[index]
+    try:
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range()
+        finally:
+            textpage.close()
+    finally:
+        page.close()
+
+
+# Pages extracted by the first task, which also reports the page count
+_PDF_PAGES_PER_TASK = 16
+
+
+def _extract_pdf_pages(
+    pdf_content: "bytes | str", start: int, stop: int
+) -> tuple[int, str]:
+    """Extract the text of pages [start, stop) of a PDF, one page per line block.
+
+    Takes the PDF bytes or the path of a spooled PDF, which is read lazily
+    from disk rather than loaded whole. Uses the C++ PDFium library through
+    pypdfium2 when it is installed and falls back to pure-Python PyPDF2.
+
+    Returns:
+        tuple[int, str]: The total page count and the text of the requested pages.
+    """
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        pass
+    else:
+        pdf = pdfium.PdfDocument(pdf_content)
+        try:
+            page_count = len(pdf)
+            pages = range(start, min(stop, page_count))
+            return page_count, "\n".join(_pdfium_page_text(pdf, i) for i in pages)
+        finally:
+            pdf.close()
+
+    with contextlib.ExitStack() as stack:
+        if isinstance(pdf_content, bytes):
+            source = io.BytesIO(pdf_content)
+        else:
+            source = stack.enter_context(open(pdf_content, "rb"))
+        reader_pages = PyPDF2.PdfReader(source).pages
+        page_count = len(reader_pages)
+        pages = range(start, min(stop, page_count))
+        # Older PyPDF2 releases return None for pages without a text layer
+        return page_count, "\n".join(reader_pages[i].extract_text() or "" for i in pages)
+
+
+async def _run_pdf_task(pdf_content: "bytes | str", start: int, stop: int) -> tuple[int, str]:
+    """Extract a block of PDF pages in the worker pool, or in a thread if it is broken.
+
+    Workers that fail to start (e.g. when the main module lacks a
+    ``__main__`` guard) break the pool; extraction then continues in a thread
+    so the document is not lost.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            _pdf_pool(), _extract_pdf_pages, pdf_content, start, stop
+        )
+    except concurrent.futures.process.BrokenProcessPool:
+        logging.warning("PDF worker pool is unavailable; extracting in a thread")
+        return await asyncio.to_thread(_extract_pdf_pages, pdf_content, start, stop)
+
+
+async def _extract_pdf_text(pdf_content: "bytes | str") -> str:
+    """Extract the text of every page of a PDF in the worker pool.
+
+    Parsing is CPU-bound, so it runs off the event loop. The first task also
+    reports the page count; the remaining pages of a long PDF are then split
+    into one contiguous range per worker, so each worker receives and parses
+    the PDF only once.
+    """
+    step = _PDF_PAGES_PER_TASK
+    page_count, first = await _run_pdf_task(pdf_content, 0, step)
+    remaining = page_count - step
+    rest: list[tuple[int, str]] = []
+    if remaining > 0:
+        tasks = min(_pdf_worker_count(), math.ceil(remaining / step))
+        size = math.ceil(remaining / tasks)
+        rest = await asyncio.gather(
+            *(
+                _run_pdf_task(pdf_content, start, start + size)
+                for start in range(step, page_count, size)
+            )
+        )
+    return "\n".join([first, *(text for _, text in rest)]).strip()
+
+
+async def _pdf_response_text(response: "aiohttp.ClientResponse") -> str:
+    """Extract the text of a successful PDF response."""
+    pdf_content = await _spool_pdf(response)
+    try:
+        return await _extract_pdf_text(pdf_content)
+    finally:
+        if isinstance(pdf_content, str):
+            await asyncio.to_thread(os.unlink, pdf_content)
+
+
+async def extract_text_from_pdf_url(
+    pdf_url: str, session: "aiohttp.ClientSession | None" = None
+) -> str:
     """Extract text content from a PDF URL.
 
     Args:
         pdf_url (str): URL pointing to a PDF file.
+        session (Optional[aiohttp.ClientSession]): Session to reuse; a new one is opened if omitted.
 
     Returns:
         str: Extracted text content from the PDF.
@@ -273,29 +726,66 @@ async def extract_text_from_pdf_url(pdf_url: str) -> str:
         return "Document processing dependencies not available. Please install: pip install aiohttp PyPDF2"
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(pdf_url) as response:
+        async with _client_session(session) as session:
+            async with _get_with_retries(session, pdf_url, headers=_PDF_HEADERS) as response:
                 if response.status == 200:
-                    pdf_content = await response.read()
-                    pdf_file = io.BytesIO(pdf_content)
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-
-                    text = ""
-                    for page in pdf_reader.pages:
-                        text += page.extract_text() + "\n"
-
-                    return text.strip()
+                    return await _pdf_response_text(response)
                 else:
                     return f"Failed to download PDF: HTTP {response.status}"
     except Exception as e:
         return f"Error processing PDF: {str(e)}"
 
 
-async def extract_text_from_web_url(web_url: str) -> str:
+_WS_RE = re.compile(r"\s+")
+
+
+def _html_to_text(html_content: str) -> str:
+    """Extract the text of an HTML page without scripts and styles, whitespace collapsed.
+
+    Uses the C-backed selectolax parser when it is installed and falls back to
+    BeautifulSoup otherwise, with the lxml tree builder if available and the
+    pure-Python html.parser as a last resort.
+    """
+    try:
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        from bs4 import BeautifulSoup, FeatureNotFound
+
+        try:
+            soup = BeautifulSoup(html_content, "lxml")
+        except FeatureNotFound:
+            soup = BeautifulSoup(html_content, "html.parser")
+
+        # Remove script and style elements
+        for script in soup(["script", "style"]):
+            script.decompose()
+
+        # Extract text
+        text = soup.get_text()
+    else:
+        tree = HTMLParser(html_content)
+        tree.strip_tags(["script", "style"])
+        text = tree.root.text(separator="") if tree.root else ""
+
+    # Clean up whitespace
+    return _WS_RE.sub(" ", text).strip()
+
+
+async def _web_response_text(response: "aiohttp.ClientResponse") -> str:
+    """Extract the text of a successful web page response."""
+    html_content = await response.text()
+    # Parsing a large page takes long enough to stall other fetches; keep it off the event loop
+    return await asyncio.to_thread(_html_to_text, html_content)
+
+
+async def extract_text_from_web_url(
+    web_url: str, session: "aiohttp.ClientSession | None" = None
+) -> str:
     """Extract text content from a web URL.
 
     Args:
         web_url (str): URL pointing to a web page.
+        session (Optional[aiohttp.ClientSession]): Session to reuse; a new one is opened if omitted.
 
     Returns:
         str: Extracted text content from the web page.
@@ -304,29 +794,10 @@ async def extract_text_from_web_url(web_url: str) -> str:
         return "Document processing dependencies not available. Please install: pip install aiohttp beautifulsoup4"
 
     try:
-        from bs4 import BeautifulSoup
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(web_url) as response:
+        async with _client_session(session) as session:
+            async with _get_with_retries(session, web_url) as response:
                 if response.status == 200:
-                    html_content = await response.text()
-                    soup = BeautifulSoup(html_content, "html.parser")
-
-                    # Remove script and style elements
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-
-                    # Extract text
-                    text = soup.get_text()
-
-                    # Clean up whitespace
-                    lines = (line.strip() for line in text.splitlines())
-                    chunks = (
-                        phrase.strip() for line in lines for phrase in line.split("  ")
-                    )
-                    text = " ".join(chunk for chunk in chunks if chunk)
-
-                    return text
+                    return await _web_response_text(response)
                 else:
                     return f"Failed to access URL: HTTP {response.status}"
     except ImportError:
@@ -335,94 +806,269 @@ async def extract_text_from_web_url(web_url: str) -> str:
         return f"Error processing web page: {str(e)}"
 
 
-async def create_documents_from_urls(urls: List[str]) -> List[Document]:
-    """Create Document objects from a list of URLs with enhanced error handling and content validation.
+def _is_pdf_url(url: str) -> bool:
+    """Whether a URL is fetched as a PDF rather than a web page."""
+    return urlparse(url).path.lower().endswith(".pdf")
+
+
+def _url_document(url: str, content: str) -> Document:
+    """Wrap the text extracted from a URL in a Document with its source metadata."""
+    parsed_url = urlparse(url)
+    # Strip once here so downstream validation and indexing can use it as-is
+    content = content.strip()
+    content_length = len(content)
+
+    # Determine if extraction was successful
+    extraction_success = not (
+        content.startswith(EXTRACTION_ERROR_PREFIXES) or
+        content == url or
+        content_length < 100
+    )
+
+    return Document(
+        page_content=content,
+        metadata={
+            "source": url,
+            "type": "pdf" if _is_pdf_url(url) else "webpage",
+            "title": parsed_url.path.split("/")[-1] or parsed_url.netloc,
+            "extraction_success": extraction_success,
+            "content_length": content_length
+        },
+    )
+
+
+async def fetch_url_document(
+    url: str, session: "aiohttp.ClientSession | None" = None
+) -> Document:
+    """Fetch a single URL and always return a Document (with error info if needed).
+
+    The extracted text is stored stripped of surrounding whitespace, with its
+    length recorded in the `content_length` metadata.
 
     Args:
-        urls (List[str]): List of URLs to process.
+        url (str): URL of a PDF file or web page.
+        session (Optional[aiohttp.ClientSession]): Session to reuse; a new one is opened if omitted.
 
     Returns:
-        List[Document]: List of Document objects with extracted content or error information.
+        Document: The extracted content, or a Document describing the failure.
+    """
+    try:
+        if _is_pdf_url(url):
+            content = await extract_text_from_pdf_url(url, session)
+        else:
+            content = await extract_text_from_web_url(url, session)
+        return _url_document(url, content)
+    except Exception as e:
+        logging.error("Error processing %s: %s", url, str(e))
+        return Document(
+            page_content=f"Error processing URL: {str(e)}",
+            metadata={
+                "source": url,
+                "type": "error",
+                "title": "Processing Error",
+                "extraction_success": False,
+                "content_length": 0
+            },
+        )
+
+
+def _extraction_path(cache_dir: str, url: str) -> str:
+    """Path of the on-disk cache entry for a URL."""
+    return os.path.join(cache_dir, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+
+def _load_extraction(cache_dir: str, url: str) -> dict | None:
+    """Read a URL's cached extraction and validators, or None if there is none."""
+    try:
+        with open(_extraction_path(cache_dir, url), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store_extraction(cache_dir: str, url: str, doc: Document, validators: dict) -> None:
+    """Write a URL's extraction and validators, replacing any earlier entry atomically."""
+    path = _extraction_path(cache_dir, url)
+    entry = {"page_content": doc.page_content, "metadata": doc.metadata, **validators}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(entry, f)
+        os.replace(f.name, path)
+    except OSError as e:
+        logging.warning("Could not cache the extraction of %s: %s", url, e)
+
+
+async def _fetch_url_document_revalidated(
+    url: str, session: "aiohttp.ClientSession | None", cache_dir: str
+) -> Document:
+    """Fetch a URL through the on-disk extraction cache.
+
+    A cached extraction is revalidated with a conditional request carrying
+    its ETag and Last-Modified validators; on 304 Not Modified it is reused
+    without downloading or parsing the body. Otherwise the response is
+    extracted and, if successful and the server sent validators, cached.
+    Other statuses and errors produce the same error documents as
+    `fetch_url_document`, without fetching the URL again.
+    """
+    entry = await asyncio.to_thread(_load_extraction, cache_dir, url)
+    headers = dict(_PDF_HEADERS) if _is_pdf_url(url) else {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    is_pdf = _is_pdf_url(url)
+    validators: dict = {}
+    try:
+        async with _client_session(session) as own_session:
+            async with _get_with_retries(own_session, url, headers=headers) as response:
+                if response.status == 304 and entry is not None:
+                    return Document(page_content=entry["page_content"], metadata=entry["metadata"])
+                if response.status == 200:
+                    if is_pdf:
+                        content = await _pdf_response_text(response)
+                    else:
+                        content = await _web_response_text(response)
+                    validators = {
+                        key: response.headers[header]
+                        for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified"))
+                        if header in response.headers
+                    }
+                elif is_pdf:
+                    content = f"Failed to download PDF: HTTP {response.status}"
+                else:
+                    # Includes a 304 to a request that carried no validators
+                    content = f"Failed to access URL: HTTP {response.status}"
+    except Exception as e:
+        logging.warning("Error processing %s: %s", url, e)
+        kind = "PDF" if is_pdf else "web page"
+        content = f"Error processing {kind}: {str(e)}"
+
+    doc = _url_document(url, content)
+    if doc.metadata["extraction_success"] and validators:
+        await asyncio.to_thread(_store_extraction, cache_dir, url, doc, validators)
+    return doc
+
+
+# Completed documents kept per create_documents_from_urls call for repeated URLs
+_REPEAT_CACHE_SIZE = 256
+
+
+def _copy_document(doc: Document) -> Document:
+    """Copy a document so that callers annotating its metadata don't share it."""
+    return Document(page_content=doc.page_content, metadata=dict(doc.metadata))
+
+
+async def create_documents_from_urls(
+    urls: Iterable[str], max_concurrency: int = 8, cache_dir: str | None = None
+) -> AsyncIterator[tuple[str, Document]]:
+    """Create Document objects from URLs with enhanced error handling and content validation.
+
+    URLs are fetched concurrently over one shared HTTP session, so connections
+    and DNS lookups are reused across URLs, with at most `max_concurrency`
+    requests in flight at once so large batches do not open one socket per URL. URLs are
+    pulled from `urls` only as fetch slots free up and results are yielded as
+    soon as each fetch completes, so neither side is held in memory in full.
+    Repeated URLs are downloaded once per batch.
+
+    Args:
+        urls (Iterable[str]): URLs to process.
+        max_concurrency (int): Maximum number of URLs fetched at the same time (default: 8).
+        cache_dir (Optional[str]): Directory of the on-disk extraction cache; None disables it.
+
+    Yields:
+        tuple[str, Document]: (url, Document) pairs with extracted content or error information,
+            in completion order.
     """
     if not DOCUMENT_PROCESSING_AVAILABLE:
         logging.warning(
             "Document processing dependencies not available. Please install: pip install aiohttp PyPDF2 beautifulsoup4"
         )
-        # Return documents with error information instead of empty list
-        return [
-            Document(
+        # Yield documents with error information instead of nothing
+        for url in urls:
+            yield url, Document(
                 page_content="Document processing dependencies not available. Please install: pip install aiohttp PyPDF2 beautifulsoup4",
                 metadata={"source": url, "type": "error", "title": "Dependency Error", "extraction_success": False}
-            ) for url in urls
-        ]
-
-    documents = []
-
-    async def process_url(url: str) -> Document:
-        """Process a single URL and always return a Document (with error info if needed)."""
-        try:
-            parsed_url = urlparse(url)
-            if parsed_url.path.lower().endswith(".pdf"):
-                content = await extract_text_from_pdf_url(url)
-                doc_type = "pdf"
-            else:
-                content = await extract_text_from_web_url(url)
-                doc_type = "webpage"
-
-            # Determine if extraction was successful
-            extraction_success = not (
-                content.startswith(("Failed", "Error", "Document processing dependencies")) or
-                content == url or
-                len(content.strip()) < 100
             )
+        return
 
-            return Document(
-                page_content=content,
-                metadata={
-                    "source": url,
-                    "type": doc_type,
-                    "title": parsed_url.path.split("/")[-1] or parsed_url.netloc,
-                    "extraction_success": extraction_success,
-                    "content_length": len(content.strip())
-                },
-            )
+    async def safe_fetch(url: str) -> tuple[str, Document]:
+        try:
+            if cache_dir:
+                return url, await _fetch_url_document_revalidated(url, session, cache_dir)
+            return url, await fetch_url_document(url, session)
         except Exception as e:
-            logging.error("Error processing %s: %s", url, str(e))
-            return Document(
-                page_content=f"Error processing URL: {str(e)}",
+            # Handle exceptions that weren't caught in fetch_url_document
+            return url, Document(
+                page_content=f"Exception during processing: {str(e)}",
                 metadata={
                     "source": url,
                     "type": "error",
-                    "title": "Processing Error",
+                    "title": "Processing Exception",
                     "extraction_success": False,
                     "content_length": 0
                 },
             )
 
-    # Process all URLs concurrently using gather
-    tasks = [process_url(url) for url in urls]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    for i, result in enumerate(results):
-        if isinstance(result, Document):
-            documents.append(result)
-        elif isinstance(result, Exception):
-            # Handle exceptions that weren't caught in process_url
-            source_url = urls[i] if i < len(urls) else "Unknown"
-            documents.append(
-                Document(
-                    page_content=f"Exception during processing: {str(result)}",
-                    metadata={
-                        "source": source_url,
-                        "type": "error",
-                        "title": "Processing Exception",
-                        "extraction_success": False,
-                        "content_length": 0
-                    },
+    limit = max(1, max_concurrency)
+    url_iter = iter(urls)
+    pending: set[asyncio.Task[tuple[str, Document]]] = set()
+    # Repeated URLs are only fetched once per call: a repeat of a URL still
+    # being fetched waits for that fetch, and a repeat of a finished one is
+    # answered from the documents completed in this call. Nothing is shared
+    # across calls, so cancelling one call never affects another.
+    in_flight: set[str] = set()
+    waiting: dict[str, int] = {}
+    completed: OrderedDict[str, Document] = OrderedDict()
+    failed: dict[str, Document] = {}
+    connector = aiohttp.TCPConnector(limit=limit, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=_fetch_timeout()) as session:
+        try:
+            while True:
+                # Top up the in-flight fetches from the (possibly lazy) URL source
+                while len(pending) < limit:
+                    url = next(url_iter, None)
+                    if url is None:
+                        break
+                    if url in in_flight:
+                        waiting[url] = waiting.get(url, 0) + 1
+                        continue
+                    earlier = failed.get(url) or completed.get(url)
+                    if earlier is not None:
+                        if url in completed:
+                            completed.move_to_end(url)
+                        yield url, _copy_document(earlier)
+                        continue
+                    in_flight.add(url)
+                    pending.add(asyncio.ensure_future(safe_fetch(url)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
                 )
-            )
+                for task in done:
+                    url, doc = task.result()
+                    in_flight.discard(url)
+                    # Error documents are small, so every failure is remembered
+                    if doc.metadata.get("extraction_success"):
+                        completed[url] = _copy_document(doc)
+                        if len(completed) > _REPEAT_CACHE_SIZE:
+                            completed.popitem(last=False)
+                    else:
+                        failed[url] = doc
+                    repeats = waiting.pop(url, 0)
+                    yield url, doc
+                    for _ in range(repeats):
+                        yield url, _copy_document(completed.get(url) or failed[url])
+        finally:
+            # The consumer stopped early; don't leave fetches running
+            for task in pending:
+                task.cancel()
 
-    return documents
 
 def format_docs_with_citations(docs: list | Document) -> str:
     """Format documents with enhanced citation information.
@@ -436,16 +1082,17 @@ def format_docs_with_citations(docs: list | Document) -> str:
     if not docs:
         return "<documents></documents>"
 
-    formatted = []
+    parts = ["<documents>"]
     for i, doc in enumerate(docs, 1):
         metadata = doc.metadata or {}
         source = metadata.get("source", f"Document_{i}")
         title = metadata.get("title", f"Document {i}")
         doc_type = metadata.get("type", "unknown")
 
-        citation_info = f'title="{title}" source="{source}" type="{doc_type}"'
-        formatted.append(f"<document {citation_info}>\n{doc.page_content}\n</document>")
+        parts.append(
+            f"\n<document title={quoteattr(str(title))} source={quoteattr(str(source))} "
+            f"type={quoteattr(str(doc_type))}>\n{doc.page_content}\n</document>"
+        )
 
-    return f"""<documents>
-{chr(10).join(formatted)}
-</documents>"""
+    parts.append("\n</documents>")
+    return "".join(parts)
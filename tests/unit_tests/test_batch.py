@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+from typing import Any
+
+from retrieval_graph import prompts
+from retrieval_graph.batch import (
+    _subject_from_result,
+    build_classification_requests,
+    classification_custom_id,
+)
+
+
+def test_build_classification_requests_sends_each_question_once() -> None:
+    questions = ["Why is the sky blue?", "Hello", "Why is the sky blue?"]
+
+    requests = build_classification_requests(questions, "anthropic/claude-3-haiku-20240307")
+
+    assert [r["custom_id"] for r in requests] == [
+        classification_custom_id("Why is the sky blue?"),
+        classification_custom_id("Hello"),
+    ]
+    params = requests[0]["params"]
+    assert params["model"] == "claude-3-haiku-20240307"
+    assert params["system"] == prompts.CLASSIFICATION_SYSTEM_PROMPT_PREFIX
+    assert params["tool_choice"] == {"type": "tool", "name": "QueryClassification"}
+
+
+def _entry(result_type: str, tool_input: Any = None) -> SimpleNamespace:
+    content = [
+        SimpleNamespace(type="text", text="Classifying."),
+        SimpleNamespace(type="tool_use", input=tool_input),
+    ]
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(result=SimpleNamespace(type=result_type, message=message))
+
+
+def test_subject_from_result_validates_the_tool_input() -> None:
+    assert _subject_from_result(_entry("succeeded", {"subject": "history"})) == "history"
+    assert _subject_from_result(_entry("succeeded", {"subject": "cooking"})) is None
+    assert _subject_from_result(_entry("succeeded", {})) is None
+    assert _subject_from_result(_entry("errored")) is None
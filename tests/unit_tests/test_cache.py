@@ -0,0 +1,45 @@
+import pytest
+
+from retrieval_graph import cache as cache_module
+from retrieval_graph.cache import SemanticCache, TTLCache
+
+
+def test_semantic_cache_matches_similar_questions_only() -> None:
+    cache = SemanticCache()
+    cache.store(("u1", "science"), [1.0, 0.0], "answer")
+
+    assert cache.lookup(("u1", "science"), [0.99, 0.05], threshold=0.9) == "answer"
+    assert cache.lookup(("u1", "science"), [0.0, 1.0], threshold=0.9) is None
+    assert cache.lookup(("u2", "science"), [1.0, 0.0], threshold=0.9) is None
+
+
+def test_semantic_cache_evicts_least_frequently_used() -> None:
+    cache = SemanticCache(max_entries=2)
+    cache.store("k", [1.0, 0.0], "popular")
+    cache.store("k", [0.0, 1.0], "unpopular")
+    cache.lookup("k", [1.0, 0.0], threshold=0.9)
+
+    cache.store("k", [-1.0, 0.0], "new")
+
+    assert cache.lookup("k", [1.0, 0.0], threshold=0.9) == "popular"
+    assert cache.lookup("k", [0.0, 1.0], threshold=0.9) is None
+    assert cache.lookup("k", [-1.0, 0.0], threshold=0.9) == "new"
+
+
+def test_ttl_cache_expires_and_evicts(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=2)
+
+    cache.set("a", 1, ttl=10)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") == 1
+    cache.set("c", 3, ttl=60)  # evicts "b", the least recently used
+    assert cache.get("b") is None
+
+    now[0] += 30
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+
+    cache.discard_where(lambda key: key == "c")
+    assert cache.get("c") is None
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from retrieval_graph import classification
+from retrieval_graph.classification import EmbeddingClassifier, keyword_subject
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeds text as counts of a few subject keywords."""
+
+    keywords = ("atom", "war", "poem", "hello")
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [float(text.lower().count(k)) + 0.01 for k in self.keywords]
+
+
+EXAMPLES = {
+    "science": ("atom atom", "the atom"),
+    "history": ("a war", "war war"),
+    "literature": ("a poem", "poem"),
+    "general": ("hello", "hello there"),
+}
+
+
+@pytest.mark.asyncio
+async def test_embedding_classifier_picks_nearest_subject() -> None:
+    classifier = await EmbeddingClassifier.from_examples(KeywordEmbeddings(), EXAMPLES)
+
+    assert await classifier.aclassify("what is an atom", margin=0.1) == "science"
+    assert await classifier.aclassify("a poem about war", margin=0.1) is None
+
+
+def test_keyword_subject_routes_only_clear_signals() -> None:
+    assert keyword_subject("Hello there!") == "general"
+    assert keyword_subject("Explain quantum entanglement") == "science"
+    assert keyword_subject("Why did the Roman Empire fall?") == "history"
+    assert keyword_subject("Write a poem about quantum physics") is None
+    assert keyword_subject("How do I cook rice?") is None
+
+
+def test_get_classifier_is_built_once_across_event_loops(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    encoders = []
+
+    def fake_encoder(model: str) -> Embeddings:
+        encoders.append(model)
+        return KeywordEmbeddings()
+
+    monkeypatch.setattr(classification, "make_text_encoder", fake_encoder)
+    monkeypatch.setattr(classification, "_CLASSIFIERS", {})
+
+    async def classify_concurrently() -> list[EmbeddingClassifier]:
+        return await asyncio.gather(
+            *(classification.get_classifier("fake/model") for _ in range(3))
+        )
+
+    first = asyncio.run(classify_concurrently())
+    second = asyncio.run(classify_concurrently())
+
+    assert encoders == ["fake/model"]
+    assert all(classifier is first[0] for classifier in first + second)
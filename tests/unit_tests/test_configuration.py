@@ -1,5 +1,36 @@
+import pytest
+
 from retrieval_graph.configuration import Configuration
 
 
 def test_configuration_from_none() -> None:
     Configuration.from_runnable_config({"user_id": "foo"})
+
+
+def test_configuration_from_runnable_config_returns_independent_copies() -> None:
+    first = Configuration.from_runnable_config(
+        {"configurable": {"user_id": "foo", "thread_id": "1"}}
+    )
+    first.search_kwargs["k"] = 99
+    second = Configuration.from_runnable_config(
+        {"configurable": {"user_id": "foo", "thread_id": "2"}}
+    )
+    assert first is not second
+    assert second.search_kwargs["k"] == 1
+
+
+def test_configuration_defaults_follow_environment_changes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    config = {"configurable": {"user_id": "foo"}}
+    monkeypatch.setenv("TAVILY_API_KEY", "first")
+    assert Configuration.from_runnable_config(config).web_search_api_key == "first"
+    monkeypatch.setenv("TAVILY_API_KEY", "second")
+    assert Configuration.from_runnable_config(config).web_search_api_key == "second"
+
+
+def test_configuration_with_unhashable_values() -> None:
+    config = Configuration.from_runnable_config(
+        {"configurable": {"user_id": "foo", "search_kwargs": {"k": 3}}}
+    )
+    assert config.search_kwargs == {"k": 3}
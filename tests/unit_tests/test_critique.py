@@ -0,0 +1,28 @@
+from langchain_core.documents import Document
+
+from retrieval_graph.critique import (
+    IMPROVE_QUERY_THRESHOLD,
+    RESPOND_THRESHOLD,
+    score_response,
+)
+
+
+def test_score_response_accepts_small_talk() -> None:
+    score, _ = score_response("Hello!", "Hi there, how can I help?", [])
+    assert score >= RESPOND_THRESHOLD
+
+
+def test_score_response_separates_good_and_poor_answers() -> None:
+    docs = [Document(page_content="...", metadata={"source": "photosynthesis.pdf"})]
+    question = "How does photosynthesis produce glucose in plants?"
+    good = (
+        "Photosynthesis in plants uses light energy to turn carbon dioxide and water "
+        "into glucose. " * 12
+        + "[Source: photosynthesis.pdf]"
+    )
+
+    good_score, _ = score_response(question, good, docs)
+    poor_score, _ = score_response(question, "I am not sure.", docs)
+
+    assert good_score >= RESPOND_THRESHOLD
+    assert poor_score < IMPROVE_QUERY_THRESHOLD
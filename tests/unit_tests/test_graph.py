@@ -0,0 +1,263 @@
+import sys
+from typing import Any
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+import retrieval_graph  # noqa: F401
+from retrieval_graph import retrieval
+from retrieval_graph.schemas import CritiqueDecision, QueryClassification
+from retrieval_graph.state import State
+
+# The package re-exports the compiled graph under the module's name
+graph_module = sys.modules["retrieval_graph.graph"]
+
+
+def _fake_structured_model(
+    monkeypatch: pytest.MonkeyPatch, respond: Any
+) -> list[list[BaseMessage]]:
+    """Replace the structured model with one answering each prompt via `respond`."""
+    prompts: list[list[BaseMessage]] = []
+
+    def invoke(messages: list[BaseMessage]) -> Any:
+        prompts.append(messages)
+        return respond(messages[-1].content)
+
+    monkeypatch.setattr(
+        graph_module, "_structured_model", lambda name, schema: RunnableLambda(invoke)
+    )
+    return prompts
+
+
+@pytest.mark.asyncio
+async def test_classify_batch_returns_subjects_in_input_order(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def respond(prompt: str) -> QueryClassification:
+        return QueryClassification(subject="history" if "Rome" in prompt else "science")
+
+    prompts = _fake_structured_model(monkeypatch, respond)
+    questions = ["Why did Rome fall?", "Why is the sky blue?", "Who founded Rome?"]
+
+    subjects = await graph_module.classify_batch(questions, {"configurable": {"user_id": "u1"}})
+
+    assert subjects == ["history", "science", "history"]
+    assert len(prompts) == 3
+    assert all(question in str(p[-1].content) for question, p in zip(questions, prompts))
+
+
+@pytest.mark.asyncio
+async def test_critique_batch_returns_one_decision_per_item(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def respond(prompt: str) -> CritiqueDecision:
+        decision = "retry" if "I don't know" in prompt else "respond"
+        return CritiqueDecision(decision=decision, reasoning="fake")
+
+    _fake_structured_model(monkeypatch, respond)
+    items = [
+        ("What is DNA?", "DNA carries genetic information.", "doc about DNA"),
+        ("Who was Caesar?", "I don't know.", "doc about Rome"),
+    ]
+
+    decisions = await graph_module.critique_batch(items, {"configurable": {"user_id": "u1"}})
+
+    assert [d.decision for d in decisions] == ["respond", "retry"]
+
+
+def test_compile_prompt_renders_plain_text_without_cache_control() -> None:
+    render = graph_module._compile_prompt("Static rules.", "Docs:\n{docs}\nQ: {question}")
+
+    system, human = render(docs=["doc one\n", "doc two\n", ""], question="Why?")
+
+    assert system.content == "Static rules."
+    assert human.content == "Docs:\ndoc one\ndoc two\n\nQ: Why?"
+
+
+def test_compile_prompt_marks_the_last_stable_block_for_caching() -> None:
+    render = graph_module._compile_prompt("Static rules.", "Docs:\n{docs}\nQ: {question}")
+
+    system, human = render(
+        cache_prefix=True, docs=["doc one\n", "doc two\n", ""], question="Why?"
+    )
+
+    assert system.content == [
+        {"type": "text", "text": "Static rules.", "cache_control": {"type": "ephemeral"}}
+    ]
+    assert human.content == [
+        {"type": "text", "text": "Docs:\ndoc one\n"},
+        {"type": "text", "text": "doc two\n", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "\nQ: Why?"},
+    ]
+
+
+def test_agent_prompt_caches_documents_independently_of_the_question() -> None:
+    docs = ["doc one\n", "doc two\n", ""]
+    renders = [
+        graph_module._AGENT_PROMPTS["science"](
+            cache_prefix=True, retrieved_docs=docs, question=question, critique_feedback="None"
+        )[1].content
+        for question in ("Why?", "How?")
+    ]
+
+    # Everything up to the cache breakpoint is shared between the two questions
+    assert renders[0][:2] == renders[1][:2]
+    assert renders[0][1]["cache_control"] == {"type": "ephemeral"}
+    assert renders[0][2] != renders[1][2]
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    calls: int = 0
+
+    async def aembed_query(self, text: str) -> list[float]:
+        self.calls += 1
+        return [1.0, 0.0, 0.0, 0.0]
+
+
+@pytest.mark.asyncio
+async def test_specialist_agent_embeds_the_question_once_per_turn(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    encoder = CountingEmbeddings(size=4)
+    monkeypatch.setattr(retrieval, "make_text_encoder", lambda model: encoder)
+    monkeypatch.setattr(graph_module, "_QUESTION_VECTORS", graph_module.OrderedDict())
+    monkeypatch.setattr(
+        graph_module,
+        "_tooled_model",
+        lambda name: RunnableLambda(lambda messages: AIMessage(content="")),
+    )
+    config = {"configurable": {"user_id": "u1", "semantic_cache": True}}
+    state = State(messages=[HumanMessage(content="Why is the sky blue?")])
+
+    for _ in range(3):
+        await graph_module.specialist_agent(state, config=config, subject="science")
+
+    assert encoder.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_specialist_agent_logs_embedding_failures(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    def failing_encoder(model: str) -> object:
+        raise RuntimeError("encoder down")
+
+    monkeypatch.setattr(retrieval, "make_text_encoder", failing_encoder)
+    monkeypatch.setattr(graph_module, "_QUESTION_VECTORS", graph_module.OrderedDict())
+    monkeypatch.setattr(
+        graph_module,
+        "_tooled_model",
+        lambda name: RunnableLambda(lambda messages: AIMessage(content="An answer.")),
+    )
+    config = {"configurable": {"user_id": "u1", "semantic_cache": True}}
+    state = State(messages=[HumanMessage(content="Why is the sky blue?")])
+
+    result = await graph_module.specialist_agent(state, config=config, subject="science")
+
+    assert result["agent_response"] == "An answer."
+    assert "response cache failed" in caplog.text
+
+
+def _fake_aretrieve(
+    monkeypatch: pytest.MonkeyPatch, result: list[Document] | Exception
+) -> list[str]:
+    """Replace retrieval.aretrieve, returning `result` or raising it."""
+    queries: list[str] = []
+
+    async def aretrieve(query: str, config: Any) -> list[Document]:
+        queries.append(query)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(retrieval, "aretrieve", aretrieve)
+    return queries
+
+
+@pytest.mark.asyncio
+async def test_prefetch_retrieval_does_nothing_when_disabled(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    queries = _fake_aretrieve(monkeypatch, [Document(page_content="Cats swim.")])
+    state = State(messages=[HumanMessage(content="Where do cats swim?")])
+
+    result = await graph_module.prefetch_retrieval(
+        state, config={"configurable": {"user_id": "u1"}}
+    )
+
+    assert result == {}
+    assert queries == []
+
+
+@pytest.mark.asyncio
+async def test_prefetch_retrieval_merges_new_documents(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    known = Document(page_content="Cats swim in bowls.")
+    found = Document(page_content="Dogs swim in lakes.")
+    queries = _fake_aretrieve(
+        monkeypatch, [Document(page_content=known.page_content), found]
+    )
+    state = State(
+        messages=[HumanMessage(content="Where do cats swim?")], retrieved_docs=[known]
+    )
+    config = {"configurable": {"user_id": "u1", "prefetch_retrieval": True}}
+
+    result = await graph_module.prefetch_retrieval(state, config=config)
+
+    assert queries == ["Where do cats swim?"]
+    assert [doc.page_content for doc in result["retrieved_docs"]] == [
+        "Cats swim in bowls.",
+        "Dogs swim in lakes.",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_graph_continues_when_prefetching_fails(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    _fake_aretrieve(monkeypatch, RuntimeError("search down"))
+
+    def structured(name: str, schema: type) -> RunnableLambda:
+        if schema is QueryClassification:
+            return RunnableLambda(lambda messages: schema(subject="science"))
+        return RunnableLambda(
+            lambda messages: schema(decision="respond", reasoning="Complete.")
+        )
+
+    monkeypatch.setattr(graph_module, "_structured_model", structured)
+    monkeypatch.setattr(
+        graph_module,
+        "_tooled_model",
+        lambda name: RunnableLambda(lambda messages: AIMessage(content="They swim.")),
+    )
+    config = {"configurable": {"user_id": "u1", "prefetch_retrieval": True}}
+
+    result = await graph_module.graph.ainvoke(
+        {"messages": [("user", "Where do cats swim?")]}, config
+    )
+
+    assert result["messages"][-1].content == "They swim."
+    assert "Prefetching documents failed" in caplog.text
+
+
+def test_extend_unique_compares_contents_not_hashes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # Make every content hash collide; distinct documents must still be kept
+    monkeypatch.setattr(graph_module, "hash", lambda value: 0, raising=False)
+    retrieved = graph_module.deque([Document(page_content="Cats swim.")])
+
+    graph_module._extend_unique(
+        retrieved,
+        [
+            Document(page_content="Dogs swim."),
+            Document(page_content="Cats swim."),
+            Document(page_content="Dogs swim."),
+        ],
+    )
+
+    assert [doc.page_content for doc in retrieved] == ["Cats swim.", "Dogs swim."]
@@ -0,0 +1,172 @@
+import asyncio
+import sys
+
+import pytest
+from langchain_core.documents import Document
+
+from retrieval_graph.configuration import IndexConfiguration
+from retrieval_graph.index_graph import (
+    add_documents_in_batches,
+    ensure_docs_have_user_id,
+    index_urls,
+)
+
+
+class RecordingRetriever:
+    def __init__(self) -> None:
+        self.batches: list[list[Document]] = []
+
+    async def aadd_documents(self, docs: list[Document], **kwargs: object) -> list[str]:
+        self.batches.append(docs)
+        return [str(i) for i in range(len(docs))]
+
+
+@pytest.mark.asyncio
+async def test_add_documents_in_batches_splits_docs() -> None:
+    retriever = RecordingRetriever()
+    docs = [Document(page_content=f"doc {i}") for i in range(5)]
+
+    await add_documents_in_batches(retriever, docs, batch_size=2, concurrency=2)  # type: ignore[arg-type]
+
+    assert [len(batch) for batch in retriever.batches] == [2, 2, 1]
+    assert [d for batch in retriever.batches for d in batch] == docs
+
+
+class StoreWithIds:
+    def __init__(self, ids: set[str]) -> None:
+        self.ids = ids
+
+    async def aget_by_ids(self, ids: list[str]) -> list[Document]:
+        return [Document(id=i, page_content="") for i in ids if i in self.ids]
+
+
+@pytest.mark.asyncio
+async def test_add_documents_in_batches_skips_existing_content() -> None:
+    config = {"configurable": {"user_id": "u1"}}
+    first, second = ensure_docs_have_user_id(
+        [Document(page_content="same"), Document(page_content="new")], config
+    )
+    repeat = ensure_docs_have_user_id([Document(page_content="same")], config)[0]
+    other_user = ensure_docs_have_user_id(
+        [Document(page_content="same")], {"configurable": {"user_id": "u2"}}
+    )[0]
+    assert first.id == repeat.id != other_user.id
+
+    retriever = RecordingRetriever()
+    retriever.vectorstore = StoreWithIds({first.id})  # type: ignore[attr-defined]
+
+    await add_documents_in_batches(  # type: ignore[arg-type]
+        retriever, [first, second, repeat], batch_size=10, concurrency=1
+    )
+
+    assert retriever.batches == [[second]]
+
+
+class FakeEmbeddings:
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [[float(len(text))] for text in texts]
+
+
+class EmbeddingStore:
+    def __init__(self) -> None:
+        self.embeddings = FakeEmbeddings()
+        self.writes: list[list[tuple[str, list[float]]]] = []
+
+    async def aget_by_ids(self, ids: list[str]) -> list[Document]:
+        return []
+
+    async def aadd_embeddings(self, text_embeddings, **kwargs: object) -> list[str]:
+        self.writes.append(text_embeddings)
+        return [str(i) for i in range(len(text_embeddings))]
+
+
+@pytest.mark.asyncio
+async def test_add_documents_in_batches_pipelines_embeddings() -> None:
+    retriever = RecordingRetriever()
+    retriever.vectorstore = EmbeddingStore()  # type: ignore[attr-defined]
+    docs = ensure_docs_have_user_id(
+        [Document(page_content="a" * i) for i in range(1, 4)],
+        {"configurable": {"user_id": "u1"}},
+    )
+
+    await add_documents_in_batches(retriever, docs, batch_size=2, concurrency=1)  # type: ignore[arg-type]
+
+    assert retriever.batches == []
+    assert retriever.vectorstore.writes == [  # type: ignore[attr-defined]
+        [("a", [1.0]), ("aa", [2.0])],
+        [("aaa", [3.0])],
+    ]
+
+
+class FailingEmbeddingStore(EmbeddingStore):
+    async def aadd_embeddings(self, text_embeddings, **kwargs: object) -> list[str]:
+        raise RuntimeError("store down")
+
+
+@pytest.mark.asyncio
+async def test_add_documents_in_batches_surfaces_store_errors() -> None:
+    retriever = RecordingRetriever()
+    retriever.vectorstore = FailingEmbeddingStore()  # type: ignore[attr-defined]
+    docs = ensure_docs_have_user_id(
+        [Document(page_content=f"doc {i}") for i in range(20)],
+        {"configurable": {"user_id": "u1"}},
+    )
+
+    # The embedder fills the queue before the first write fails; it must not hang
+    with pytest.raises(RuntimeError, match="store down"):
+        await asyncio.wait_for(
+            add_documents_in_batches(retriever, docs, batch_size=1, concurrency=1),  # type: ignore[arg-type]
+            timeout=3,
+        )
+
+
+async def _fake_fetch(urls, *args: object):
+    for url in urls:
+        doc = Document(
+            page_content=f"{url} " + "text " * 100,
+            metadata={"source": url, "extraction_success": True},
+        )
+        yield url, doc
+
+
+@pytest.mark.asyncio
+async def test_index_urls_feeds_one_embedding_pipeline(monkeypatch: pytest.MonkeyPatch) -> None:
+    index_graph = sys.modules["retrieval_graph.index_graph"]
+    monkeypatch.setattr(index_graph, "create_documents_from_urls", _fake_fetch)
+    pipelines = []
+    pipelined_add = index_graph._pipelined_add
+
+    async def counting_pipelined_add(*args: object) -> None:
+        pipelines.append(args)
+        await pipelined_add(*args)
+
+    monkeypatch.setattr(index_graph, "_pipelined_add", counting_pipelined_add)
+    retriever = RecordingRetriever()
+    retriever.vectorstore = EmbeddingStore()  # type: ignore[attr-defined]
+    urls = [f"https://example.com/{i}" for i in range(5)]
+    config = {"configurable": {"user_id": "u1", "index_batch_size": 2}}
+
+    await index_urls(urls, retriever, config, IndexConfiguration.from_runnable_config(config))  # type: ignore[arg-type]
+
+    assert len(pipelines) == 1
+    assert [len(write) for write in retriever.vectorstore.writes] == [2, 2, 1]  # type: ignore[attr-defined]
+
+
+class FailingRetriever:
+    async def aadd_documents(self, docs: list[Document], **kwargs: object) -> list[str]:
+        raise RuntimeError("store down")
+
+
+@pytest.mark.asyncio
+async def test_index_urls_surfaces_store_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    # The package re-exports the compiled graph under the module's name
+    index_graph = sys.modules["retrieval_graph.index_graph"]
+    monkeypatch.setattr(index_graph, "create_documents_from_urls", _fake_fetch)
+    urls = [f"https://example.com/{i}" for i in range(50)]
+    config = {"configurable": {"user_id": "u1", "index_batch_size": 2}}
+
+    with pytest.raises(RuntimeError, match="store down"):
+        await asyncio.wait_for(
+            index_urls(urls, FailingRetriever(), config, IndexConfiguration.from_runnable_config(config)),  # type: ignore[arg-type]
+            timeout=3,
+        )
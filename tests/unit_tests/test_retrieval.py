@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import FakeEmbeddings
+
+from retrieval_graph import retrieval
+from retrieval_graph.configuration import IndexConfiguration
+
+
+@pytest.mark.asyncio
+async def test_make_elastic_retriever_shares_client_across_users(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    clients = []
+    created = []
+
+    def fake_client(configuration: IndexConfiguration) -> object:
+        clients.append(object())
+        return clients[-1]
+
+    def fake_create(
+        configuration: IndexConfiguration, embedding_model: object, es_client: object
+    ) -> object:
+        created.append((configuration.user_id, es_client))
+        return object()
+
+    monkeypatch.setattr(retrieval, "_create_elastic_client", fake_client)
+    monkeypatch.setattr(retrieval, "_create_elastic_retriever", fake_create)
+    embeddings = FakeEmbeddings(size=4)
+
+    handed_out = []
+    for user_id in ("u1", "u1", "u2"):
+        configuration = IndexConfiguration(user_id=user_id)
+        with retrieval.make_elastic_retriever(configuration, embeddings) as retriever:
+            handed_out.append(retriever)
+
+    assert len(clients) == 1
+    assert created == [("u1", clients[0]), ("u2", clients[0])]
+    assert handed_out[0] is handed_out[1]
+    assert handed_out[0] is not handed_out[2]
+
+
+def test_cached_clients_are_closed_when_the_loop_shuts_down(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    closed = []
+
+    class FakeClient:
+        async def close(self) -> None:
+            closed.append(self)
+
+    monkeypatch.setattr(retrieval, "_create_elastic_client", lambda configuration: FakeClient())
+    monkeypatch.setattr(
+        retrieval, "_create_elastic_retriever", lambda configuration, embeddings, client: object()
+    )
+
+    async def use_retrievers() -> None:
+        for user_id in ("u1", "u2"):
+            configuration = IndexConfiguration(user_id=user_id)
+            async with retrieval.make_elastic_retriever_async(
+                configuration, FakeEmbeddings(size=4)
+            ):
+                pass
+        assert not closed
+
+    asyncio.run(use_retrievers())
+
+    assert len(closed) == 1
@@ -0,0 +1,518 @@
+import asyncio
+import concurrent.futures
+import logging
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, AsyncIterator
+
+import pytest
+from langchain_core.documents import Document
+
+from retrieval_graph import utils
+
+
+class FakeContent:
+    def __init__(self, body: bytes, chunk_size: int | None = None) -> None:
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def iter_chunked(self, size: int) -> AsyncIterator[bytes]:
+        size = self.chunk_size or size
+        for start in range(0, len(self.body), size):
+            yield self.body[start : start + size]
+
+
+class FakeResponse:
+    def __init__(
+        self, status: int, body: bytes = b"", headers: dict[str, str] | None = None
+    ) -> None:
+        self.status = status
+        self.headers = headers or {}
+        self.content = FakeContent(body)
+        self.content_length = len(body)
+
+    async def text(self) -> str:
+        return self.content.body.decode()
+
+    def release(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "FakeResponse":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        pass
+
+
+class FakeSession:
+    """Answer GETs from a list of responses per URL, repeating the last one."""
+
+    def __init__(self, responses: dict[str, list[Any]]) -> None:
+        self.responses = responses
+        self.requests: list[tuple[str, dict[str, Any]]] = []
+
+    async def get(self, url: str, **kwargs: Any) -> FakeResponse:
+        self.requests.append((url, kwargs))
+        answers = self.responses[url]
+        answer = answers.pop(0) if len(answers) > 1 else answers[0]
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    """Record retry delays instead of sleeping through them."""
+    delays: list[float] = []
+    sleep = asyncio.sleep
+
+    async def fake_sleep(delay: float) -> None:
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(utils.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+PAGE = b"<p>" + b"Cats swim in bowls. " * 20 + b"</p>"
+
+
+@pytest.mark.asyncio
+async def test_revalidated_fetch_does_not_refetch_failures(
+    tmp_path: Any, no_backoff: list[float]
+) -> None:
+    session = FakeSession({"https://x.test/a": [FakeResponse(503)]})
+
+    doc = await utils._fetch_url_document_revalidated(
+        "https://x.test/a",
+        session,
+        str(tmp_path),  # type: ignore[arg-type]
+    )
+
+    assert doc.page_content == "Failed to access URL: HTTP 503"
+    assert doc.metadata["extraction_success"] is False
+    assert len(session.requests) == utils._FETCH_ATTEMPTS
+
+
+@pytest.mark.asyncio
+async def test_revalidated_fetch_reuses_cached_extraction_on_304(tmp_path: Any) -> None:
+    url = "https://x.test/page"
+    session = FakeSession(
+        {url: [FakeResponse(200, PAGE, {"ETag": '"v1"'}), FakeResponse(304)]}
+    )
+
+    first = await utils._fetch_url_document_revalidated(url, session, str(tmp_path))  # type: ignore[arg-type]
+    second = await utils._fetch_url_document_revalidated(url, session, str(tmp_path))  # type: ignore[arg-type]
+
+    assert first.metadata["extraction_success"] is True
+    assert second == first
+    assert session.requests[1][1]["headers"]["If-None-Match"] == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_revalidated_fetch_rejects_unsolicited_304(tmp_path: Any) -> None:
+    session = FakeSession({"https://x.test/a": [FakeResponse(304)]})
+
+    doc = await utils._fetch_url_document_revalidated(
+        "https://x.test/a",
+        session,
+        str(tmp_path),  # type: ignore[arg-type]
+    )
+
+    assert doc.page_content == "Failed to access URL: HTTP 304"
+    assert len(session.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_extract_pdf_text_sends_one_page_range_per_worker(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    ranges = []
+
+    async def fake_task(pdf_content: bytes, start: int, stop: int) -> tuple[int, str]:
+        ranges.append((start, min(stop, 200)))
+        return 200, f"{start}-{min(stop, 200)}"
+
+    monkeypatch.setattr(utils, "_run_pdf_task", fake_task)
+    monkeypatch.setattr(utils, "_pdf_worker_count", lambda: 4)
+
+    text = await utils._extract_pdf_text(b"%PDF")
+
+    assert len(ranges) == 1 + 4
+    # The ranges cover every page exactly once, in order
+    assert [r[0] for r in ranges[1:]] == [r[1] for r in ranges[:-1]]
+    assert ranges[-1][1] == 200
+    assert text.splitlines()[0] == "0-16"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+async def test_get_with_retries_stops_after_three_attempts(
+    status: int, no_backoff: list[float]
+) -> None:
+    session = FakeSession({"https://x.test/a": [FakeResponse(status)]})
+
+    async with utils._get_with_retries(session, "https://x.test/a") as response:  # type: ignore[arg-type]
+        assert response.status == status
+
+    assert len(session.requests) == 3
+    assert len(no_backoff) == 2
+    assert no_backoff[0] < no_backoff[1]
+
+
+@pytest.mark.asyncio
+async def test_get_with_retries_returns_first_non_transient_response(
+    no_backoff: list[float],
+) -> None:
+    session = FakeSession(
+        {
+            "https://x.test/a": [FakeResponse(429), FakeResponse(200, PAGE)],
+            "https://x.test/missing": [FakeResponse(404)],
+        }
+    )
+
+    async with utils._get_with_retries(session, "https://x.test/a") as response:  # type: ignore[arg-type]
+        assert response.status == 200
+    async with utils._get_with_retries(session, "https://x.test/missing") as response:  # type: ignore[arg-type]
+        assert response.status == 404
+
+    assert [url for url, _ in session.requests] == [
+        "https://x.test/a",
+        "https://x.test/a",
+        "https://x.test/missing",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_with_retries_reraises_the_last_connection_error(
+    no_backoff: list[float],
+) -> None:
+    session = FakeSession(
+        {"https://x.test/a": [utils.aiohttp.ClientConnectionError("down")]}
+    )
+
+    with pytest.raises(utils.aiohttp.ClientConnectionError):
+        async with utils._get_with_retries(session, "https://x.test/a"):  # type: ignore[arg-type]
+            pass
+
+    assert len(session.requests) == 3
+
+
+def _fake_fetcher(
+    monkeypatch: pytest.MonkeyPatch, slow: asyncio.Event | None = None
+) -> tuple[list[str], list[str]]:
+    """Replace fetch_url_document; URLs containing "bad" fail, "slow" ones wait."""
+    fetched: list[str] = []
+    cancelled: list[str] = []
+
+    async def fake_fetch(url: str, session: object = None) -> Any:
+        fetched.append(url)
+        if "slow" in url:
+            try:
+                await (slow or asyncio.Event()).wait()
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+        if "bad" in url:
+            return utils._url_document(url, "Failed to access URL: HTTP 500")
+        return utils._url_document(url, "Cats swim in bowls. " * 10)
+
+    monkeypatch.setattr(utils, "fetch_url_document", fake_fetch)
+    return fetched, cancelled
+
+
+@pytest.mark.asyncio
+async def test_create_documents_from_urls_fetches_repeated_urls_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    fetched, _ = _fake_fetcher(monkeypatch)
+    urls = [
+        "https://x.test/a",
+        "https://x.test/bad",
+        "https://x.test/a",
+        "https://x.test/bad",
+        "https://x.test/b",
+        "https://x.test/a",
+    ]
+
+    results = [
+        pair async for pair in utils.create_documents_from_urls(urls, max_concurrency=2)
+    ]
+
+    assert sorted(fetched) == [
+        "https://x.test/a",
+        "https://x.test/b",
+        "https://x.test/bad",
+    ]
+    assert sorted(url for url, _ in results) == sorted(urls)
+    failures = [doc for url, doc in results if url == "https://x.test/bad"]
+    assert all(not doc.metadata["extraction_success"] for doc in failures)
+    repeats = [doc for url, doc in results if url == "https://x.test/a"]
+    # Repeats get equal but separate documents, so callers can annotate them
+    assert repeats[0] == repeats[1] == repeats[2]
+    assert len({id(doc.metadata) for doc in repeats}) == 3
+
+
+@pytest.mark.asyncio
+async def test_create_documents_from_urls_pulls_urls_lazily(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    _fake_fetcher(monkeypatch)
+    pulled = []
+
+    def urls() -> Any:
+        for i in range(100):
+            pulled.append(i)
+            yield f"https://x.test/{i}"
+
+    fetched = utils.create_documents_from_urls(urls(), max_concurrency=2)
+    await fetched.__anext__()
+
+    assert len(pulled) <= 3
+    await fetched.aclose()
+
+
+@pytest.mark.asyncio
+async def test_create_documents_from_urls_cancels_pending_fetches_on_close(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    _, cancelled = _fake_fetcher(monkeypatch)
+
+    fetched = utils.create_documents_from_urls(
+        ["https://x.test/slow", "https://x.test/a"], max_concurrency=2
+    )
+    url, _ = await fetched.__anext__()
+    await fetched.aclose()
+
+    assert url == "https://x.test/a"
+    assert cancelled == ["https://x.test/slow"]
+
+
+def _text_pdf(pages: list[str]) -> bytes:
+    """Build a minimal PDF with one line of Helvetica text per page."""
+    count = len(pages)
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(count))
+    font = 3 + 2 * count
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {count} >>".encode(),
+    ]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {4 + 2 * i} 0 R /Resources << /Font << /F1 {font} 0 R >> >> >>".encode()
+        )
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
+
+
+@pytest.fixture
+def spool_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
+    """Spool PDFs under tmp_path with small size thresholds."""
+    monkeypatch.setattr(utils.tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(utils, "_PDF_SPOOL_BYTES", 1000)
+    monkeypatch.setattr(utils, "_PDF_MAX_BYTES", 4000)
+    return tmp_path
+
+
+@pytest.mark.asyncio
+async def test_spool_pdf_keeps_small_pdfs_in_memory(spool_dir: Path) -> None:
+    response = FakeResponse(200, b"x" * 1000)
+
+    assert await utils._spool_pdf(response) == b"x" * 1000  # type: ignore[arg-type]
+    assert list(spool_dir.iterdir()) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("announced", [True, False])
+async def test_spool_pdf_moves_large_pdfs_to_disk(
+    spool_dir: Path, announced: bool
+) -> None:
+    body = bytes(range(256)) * 12
+    response = FakeResponse(200)
+    response.content = FakeContent(body, chunk_size=500)
+    response.content_length = len(body) if announced else None  # type: ignore[assignment]
+
+    path = await utils._spool_pdf(response)  # type: ignore[arg-type]
+
+    assert isinstance(path, str)
+    assert Path(path).parent == spool_dir
+    assert Path(path).read_bytes() == body
+
+
+@pytest.mark.asyncio
+async def test_spool_pdf_rejects_announced_oversized_pdfs(spool_dir: Path) -> None:
+    response = FakeResponse(200, b"x" * 4001)
+
+    with pytest.raises(ValueError, match="PDF exceeds 4000 bytes"):
+        await utils._spool_pdf(response)  # type: ignore[arg-type]
+
+
+@pytest.mark.asyncio
+async def test_spool_pdf_deletes_the_spool_when_the_cap_is_crossed(
+    spool_dir: Path,
+) -> None:
+    response = FakeResponse(200)
+    response.content = FakeContent(b"x" * 5000, chunk_size=500)
+    response.content_length = None  # type: ignore[assignment]
+
+    with pytest.raises(ValueError, match="PDF exceeds 4000 bytes"):
+        await utils._spool_pdf(response)  # type: ignore[arg-type]
+    assert list(spool_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize("source", ["bytes", "path"])
+def test_extract_pdf_pages_with_pypdf2(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, source: str
+) -> None:
+    monkeypatch.setitem(sys.modules, "pypdfium2", None)
+    pdf: bytes | str = _text_pdf(["Page one", "Page two", "Page three"])
+    if source == "path":
+        (tmp_path / "doc.pdf").write_bytes(pdf)
+        pdf = str(tmp_path / "doc.pdf")
+
+    page_count, text = utils._extract_pdf_pages(pdf, 1, 5)
+
+    assert page_count == 3
+    assert text.split("\n") == ["Page two", "Page three"]
+
+
+def test_extract_pdf_pages_with_pypdfium2() -> None:
+    pytest.importorskip("pypdfium2")
+
+    page_count, text = utils._extract_pdf_pages(
+        _text_pdf(["Page one", "Page two", "Page three"]), 0, 2
+    )
+
+    assert page_count == 3
+    assert "Page one" in text and "Page two" in text and "Page three" not in text
+
+
+class BrokenPool:
+    def submit(self, *args: Any) -> None:
+        raise concurrent.futures.process.BrokenProcessPool("workers died")
+
+
+@pytest.mark.asyncio
+async def test_pdf_tasks_fall_back_to_a_thread_when_the_pool_is_broken(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.setitem(sys.modules, "pypdfium2", None)
+    monkeypatch.setattr(utils, "_pdf_pool", BrokenPool)
+
+    with caplog.at_level(logging.WARNING):
+        text = await utils._extract_pdf_text(_text_pdf(["Only page"]))
+
+    assert text == "Only page"
+    assert "PDF worker pool is unavailable" in caplog.text
+
+
+class QuadEncoding:
+    """Tokenizer stand-in that makes every four characters one token, like English in cl100k."""
+
+    def encode_ordinary(self, text: str) -> list[str]:
+        return [text[i : i + 4] for i in range(0, len(text), 4)]
+
+    def encode_ordinary_batch(self, texts: list[str]) -> list[list[str]]:
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+@pytest.fixture(params=["tokenizer", "no_tokenizer"])
+def encoding(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> QuadEncoding | None:
+    """Run a test with the fake tokenizer and with the character-count fallback."""
+    encoding = QuadEncoding() if request.param == "tokenizer" else None
+    monkeypatch.setattr(utils, "_get_encoding", lambda: encoding)
+    monkeypatch.setattr(utils, "_TOKEN_COUNTS", utils.OrderedDict())
+    return encoding
+
+
+def test_estimate_tokens_counts_short_ascii_as_three_chars_per_token(
+    encoding: QuadEncoding | None,
+) -> None:
+    assert utils.estimate_tokens("") == 0
+    assert utils.estimate_tokens("abcdefg") == 3
+    assert utils.estimate_tokens("x" * 63) == 21
+    # Longer or non-ASCII text goes to the tokenizer or the 4-chars-per-token estimate
+    assert utils.estimate_tokens("x" * 64) == 16
+    assert utils.estimate_tokens("é" * 8) == 2
+
+
+def test_content_token_counts_evicts_the_least_recently_used(
+    encoding: QuadEncoding | None,
+) -> None:
+    contents = [f"content {i:03d}" for i in range(300)]
+
+    utils._content_token_counts(contents[:10])
+    counts = utils._content_token_counts(contents[10:])
+    utils._content_token_counts(contents[:1])
+
+    assert len(counts) == 290 and all(counts)
+    assert len(utils._TOKEN_COUNTS) == utils._TOKEN_COUNTS_SIZE
+    assert next(reversed(utils._TOKEN_COUNTS)) == contents[0]
+    assert contents[1] not in utils._TOKEN_COUNTS
+    assert contents[-1] in utils._TOKEN_COUNTS
+
+
+@pytest.mark.parametrize("max_tokens", [50, 100, 1000])
+def test_truncate_to_token_limit_stays_within_the_limit(
+    encoding: QuadEncoding | None, max_tokens: int
+) -> None:
+    text = "The cat sat on the mat. " * 200
+
+    truncated = utils.truncate_to_token_limit(text, max_tokens)
+
+    assert truncated.endswith(utils._TRUNCATION_MARKER)
+    assert text.startswith(truncated.removesuffix(utils._TRUNCATION_MARKER))
+    assert utils.estimate_tokens(truncated) <= max_tokens
+    assert utils.truncate_to_token_limit(text[:40], max_tokens) == text[:40]
+
+
+def test_format_docs_safe_parts_join_to_format_docs_safe(
+    encoding: QuadEncoding | None,
+) -> None:
+    docs = [
+        Document(page_content=f"Document {i}: " + "cats swim " * 40, metadata={"id": i})
+        for i in range(6)
+    ]
+    budget = 600
+
+    parts = utils.format_docs_safe_parts(docs, budget)
+    text = utils.format_docs_safe(docs, budget)
+
+    assert "".join(parts) == text
+    assert 1 < len(parts) - 1 < len(docs)
+    assert parts[0].startswith("<documents>\n<document")
+    assert parts[-1].endswith("</documents>")
+    assert f"Showing {len(parts) - 1} of 6 documents" in parts[-1]
+    assert utils.estimate_tokens(text) <= budget
+
+
+def test_get_message_text_accepts_dict_subclass_parts() -> None:
+    message = SimpleNamespace(
+        content=[OrderedDict(type="text", text="Hello"), " ", {"text": "World"}]
+    )
+
+    assert utils.get_message_text(message) == "Hello World"  # type: ignore[arg-type]